@@ -0,0 +1,211 @@
+import os
+import glob
+import heapq
+import argparse
+import datetime
+from database import init_db, get_connection, get_logs_page, iter_logs, day_range
+
+ARCHIVE_DIR = "log_archive"
+RETENTION_DAYS = 180
+# Row groups carry min/max timestamps, so a page read skips the groups it
+# cannot need instead of decoding the whole month.
+ROW_GROUP_SIZE = 65536
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("ID", pa.int64()), ("Student ID", pa.int64()), ("Name", pa.string()), ("Room", pa.string()),
+        ("Action", pa.string()), ("Timestamp", pa.string()), ("Camera", pa.string()),
+    ])
+
+
+def _partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"logs_{month}.parquet")
+
+
+def _partitions(archive_dir, lo=None, hi=None):
+    # Monthly partition files, newest first, pruned to the [lo, hi) timestamp range.
+    months = sorted((os.path.basename(p)[5:12] for p in glob.glob(os.path.join(archive_dir, "logs_*.parquet"))),
+                    reverse=True)
+    for month in months:
+        if hi is not None and month > hi[:7]:
+            continue
+        if lo is not None and month < lo[:7]:
+            continue
+        yield month, _partition_path(archive_dir, month)
+
+
+def archive_logs(older_than_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, dry_run=False):
+    # Moves logs older than the horizon into zstd Parquet files, one per
+    # month, then deletes them from the hot table. The room is stored with
+    # each row so the archive stays a complete audit trail. Re-running after
+    # an interrupted job is safe: rows already in a partition are skipped.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    cutoff = (datetime.date.today() - datetime.timedelta(days=older_than_days)).strftime('%Y-%m-%d 00:00:00')
+    con = get_connection()
+    months = [r[0] for r in con.execute(
+        "SELECT DISTINCT substr(timestamp, 1, 7) FROM logs WHERE timestamp < ? ORDER BY 1", (cutoff,))]
+    if dry_run:
+        count = con.execute("SELECT COUNT(*) FROM logs WHERE timestamp < ?", (cutoff,)).fetchone()[0]
+        return {'cutoff': cutoff, 'months': months, 'rows': count}
+    os.makedirs(archive_dir, exist_ok=True)
+    schema = _schema()
+    archived = 0
+    # Rows written while the job runs are left for the next run.
+    max_id = con.execute("SELECT MAX(id) FROM logs").fetchone()[0] or 0
+    for month in months:
+        rows = con.execute("""
+            SELECT l.id, l.student_id, l.name, s.room, l.action, l.timestamp, l.camera
+            FROM logs l LEFT JOIN students s ON s.id = l.student_id
+            WHERE l.timestamp >= ? AND l.timestamp < ? AND l.timestamp < ? AND l.id <= ?
+            ORDER BY l.timestamp DESC, l.id DESC
+        """, (f"{month}-01", f"{month}-32", cutoff, max_id)).fetchall()
+        if not rows:
+            continue
+        new = pa.table([pa.array(col, type=f.type) for col, f in zip(zip(*rows), schema)], schema=schema)
+        path = _partition_path(archive_dir, month)
+        if os.path.exists(path):
+            old = pq.read_table(path, schema=schema)
+            old_ids = set(old.column("ID").to_pylist())
+            keep = [i for i, rid in enumerate(new.column("ID").to_pylist()) if rid not in old_ids]
+            added = len(keep)
+            new = pa.concat_tables([old, new.take(keep)])
+            new = new.take(pc.sort_indices(new, [("Timestamp", "descending"), ("ID", "descending")]))
+        else:
+            added = len(rows)
+        pq.write_table(new, path + ".tmp", compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        os.replace(path + ".tmp", path)
+        archived += added
+    if months:
+        # Only rows that made it into a partition are removed from the hot table.
+        with con:
+            con.execute("DELETE FROM logs WHERE timestamp < ? AND id <= ?", (cutoff, max_id))
+    return {'cutoff': cutoff, 'months': months, 'rows': archived}
+
+
+def _archive_filter(table, lo, hi, student, room, action, before):
+    import pyarrow.compute as pc
+    mask = None
+    def both(m, cond):
+        return cond if m is None else pc.and_(m, cond)
+    ts = table.column("Timestamp")
+    if lo is not None:
+        mask = both(mask, pc.and_(pc.greater_equal(ts, lo), pc.less(ts, hi)))
+    if isinstance(student, int):
+        mask = both(mask, pc.equal(table.column("Student ID"), student))
+    elif student:
+        mask = both(mask, pc.match_substring(table.column("Name"), student, ignore_case=True))
+    if room:
+        mask = both(mask, pc.equal(table.column("Room"), room))
+    if action:
+        mask = both(mask, pc.equal(table.column("Action"), action))
+    if before is not None:
+        mask = both(mask, pc.or_(pc.less(ts, before[0]),
+                                 pc.and_(pc.equal(ts, before[0]), pc.less(table.column("ID"), before[1]))))
+    return table if mask is None else table.filter(mask)
+
+
+def _scan_partition(path, lo, hi, student, room, action, before):
+    # Matching rows of one partition, newest first, read a row group at a
+    # time. Partitions are sorted by (timestamp, id) descending, so groups
+    # entirely newer than `before` or outside [lo, hi) are skipped unread.
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(path)
+    ts_col = pf.schema_arrow.get_field_index("Timestamp")
+    for i in range(pf.metadata.num_row_groups):
+        stats = pf.metadata.row_group(i).column(ts_col).statistics
+        if stats is not None and stats.has_min_max:
+            if before is not None and stats.min > before[0]:
+                continue
+            if lo is not None and (stats.max < lo or stats.min >= hi):
+                continue
+        table = _archive_filter(pf.read_row_group(i).cast(_schema()), lo, hi, student, room, action, before)
+        # Converted in slices, so a page that needs a few rows does not
+        # build Python tuples for the whole group.
+        for offset in range(0, table.num_rows, 1024):
+            for row in table.slice(offset, 1024).to_pylist():
+                yield tuple(row.values())
+
+
+def iter_archived_logs(before=None, start=None, end=None, student=None, room=None, action=None,
+                       archive_dir=ARCHIVE_DIR):
+    # Every matching archived row, newest first; each partition is read once.
+    lo = hi = None
+    if start is not None or end is not None:
+        lo, hi = day_range(start or end, end or start)
+    for month, path in _partitions(archive_dir, lo, hi):
+        if before is not None and month > before[0][:7]:
+            continue
+        yield from _scan_partition(path, lo, hi, student, room, action, before)
+
+
+def get_archived_logs_page(limit=50, before=None, archive_dir=ARCHIVE_DIR, **filters):
+    # Same row shape and keyset semantics as database.get_logs_page.
+    rows = []
+    for row in iter_archived_logs(before, archive_dir=archive_dir, **filters):
+        rows.append(row)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def last_archived_events(archive_dir=ARCHIVE_DIR):
+    # The newest archived entry/exit per student, as (student_id, action,
+    # timestamp, camera), for database.rebuild_presence. Partitions are read
+    # newest first and are sorted within, so the first row seen wins.
+    import pyarrow.parquet as pq
+    latest = {}
+    for _, path in _partitions(archive_dir):
+        table = pq.read_table(path, columns=["Student ID", "Action", "Timestamp", "Camera"])
+        for sid, action, ts, camera in zip(*(table.column(i).to_pylist() for i in range(4))):
+            if sid is not None and action in ('entry', 'exit') and sid not in latest:
+                latest[sid] = (sid, action, ts, camera)
+    return list(latest.values())
+
+
+def _row_key(row):
+    return row[5], row[0]
+
+
+def query_logs_page(limit=50, before=None, include_archive=True, **filters):
+    # Late rows (batch_video.py, edge cameras) can land in the hot table with
+    # timestamps older than rows already archived, so the two are merged on
+    # (timestamp, id) rather than the archive just topping up the page.
+    rows = get_logs_page(limit, before, **filters)
+    if include_archive:
+        archived = get_archived_logs_page(limit, before, **filters)
+        rows = list(heapq.merge(rows, archived, key=_row_key, reverse=True))[:limit]
+    return rows
+
+
+def iter_all_logs(chunk_size=5000, **filters):
+    # iter_logs over the hot table merged with the archive, newest first.
+    hot = (row for rows in iter_logs(chunk_size, **filters) for row in rows)
+    chunk = []
+    for row in heapq.merge(hot, iter_archived_logs(**filters), key=_row_key, reverse=True):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old logs into monthly compressed Parquet partitions.")
+    parser.add_argument("--older-than-days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    args = parser.parse_args()
+    init_db()
+    result = archive_logs(args.older_than_days, args.dir, args.dry_run)
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"{verb} {result['rows']} rows older than {result['cutoff']} "
+          f"({', '.join(result['months']) or 'no months'}) -> {args.dir}/")
+
+
+if __name__ == "__main__":
+    main()
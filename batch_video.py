@@ -0,0 +1,227 @@
+import os
+import csv
+import time
+import tempfile
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from database import init_db, get_connection, add_log, flush_logs
+from gallery import FaceGallery, export_snapshot
+from scheduler import FrameScheduler
+from tracker import FaceTracker
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Frames analysed per second of video; the rest are skipped without decoding.
+ANALYSIS_FPS = 5.0
+SEGMENT_SECONDS = 60.0
+# Sightings of one student closer together than this are one event, the same
+# debounce the live cameras apply with FaceTracker.relog_after.
+DEDUP_SECONDS = 60.0
+REPORT_COLUMNS = ["timestamp", "student_id", "name", "action", "camera", "video", "position", "distance", "status"]
+
+_worker_state = {}
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise SystemExit(f"{path}: cannot open video")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        return fps, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def plan_segments(path, analysis_fps=ANALYSIS_FPS, segment_seconds=SEGMENT_SECONDS):
+    # Splits a video into (path, first_frame, end_frame, stride, fps) tasks
+    # that can be decoded independently.
+    fps, frames = video_info(path)
+    stride = max(1, int(round(fps / analysis_fps)))
+    size = max(stride, int(segment_seconds * fps) // stride * stride)
+    return [(path, start, min(start + size, frames), stride, fps) for start in range(0, frames, size)]
+
+
+def _worker_gallery(snapshot):
+    # One read-only memory-mapped gallery per worker process.
+    if _worker_state.get('snapshot') != snapshot:
+        _worker_state['gallery'] = FaceGallery.from_snapshot(snapshot)
+        _worker_state['snapshot'] = snapshot
+    return _worker_state['gallery']
+
+
+def process_segment(task, snapshot, tolerance=0.5):
+    # Runs in a worker process. Returns the recognized sightings in one
+    # segment as (student_id, name, seconds into the video, distance).
+    from face_utils import make_face_detector, detect_faces_mediapipe, encode_faces
+    path, first, end, stride, fps = task
+    gallery = _worker_gallery(snapshot)
+    detector = _worker_state.get('detector')
+    if detector is None:
+        detector = _worker_state['detector'] = make_face_detector()
+    # Tracks and intervals are counted in analysed frames, not wall time.
+    tracker = FaceTracker(max_missed=2, reverify_every=max(1, int(fps / stride)))
+    scheduler = FrameScheduler(search_interval=0.0)
+    sightings = []
+    cap = cv2.VideoCapture(path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+        for frame_no in range(first, end):
+            if (frame_no - first) % stride:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position = frame_no / fps
+            if not scheduler.should_detect(frame, bool(tracker.tracks), now=position):
+                continue
+            boxes = detect_faces_mediapipe(frame, cv2.cvtColor(scheduler.downscale(frame), cv2.COLOR_BGR2RGB),
+                                           detector)
+            scheduler.record(len(boxes), now=position)
+            tracks = tracker.update(boxes)
+            pending = [t for t in tracks if tracker.claim_recognition(t)]
+            if not pending:
+                continue
+            encodings = encode_faces(frame, [t.box for t in pending])
+            encoded = [(t, enc) for t, enc in zip(pending, encodings) if enc is not None]
+            for track, enc in zip(pending, encodings):
+                if enc is None:
+                    tracker.release(track)
+            matches = gallery.match([enc for _, enc in encoded], tolerance) if encoded else []
+            for (track, _), (sid, sname, dist) in zip(encoded, matches):
+                tracker.assign(track, sid, sname, dist)
+                if sid is not None:
+                    sightings.append((sid, sname, position, dist))
+    finally:
+        cap.release()
+    return sightings
+
+
+def dedupe_sightings(sightings, window=DEDUP_SECONDS):
+    # Collapses sightings into events: a student seen again within `window`
+    # seconds of their previous sighting is the same pass through the gate.
+    # Sightings are (student_id, name, time, distance, *source); each event
+    # keeps its first time and source and its best distance.
+    events = []
+    last = {}
+    for sid, name, position, dist, *source in sorted(sightings, key=lambda s: s[2]):
+        event = last.get(sid)
+        if event is not None and position - event['last'] <= window:
+            event['last'] = position
+            event['distance'] = min(event['distance'], dist)
+            continue
+        event = {'student_id': sid, 'name': name, 'position': position, 'last': position, 'distance': dist,
+                 'source': source}
+        last[sid] = event
+        events.append(event)
+    return events
+
+
+def _already_logged(con, student_id, action, timestamp, window):
+    ts = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    lo = (ts - datetime.timedelta(seconds=window)).strftime(TIMESTAMP_FORMAT)
+    hi = (ts + datetime.timedelta(seconds=window)).strftime(TIMESTAMP_FORMAT)
+    return con.execute("SELECT 1 FROM logs WHERE student_id = ? AND action = ? AND timestamp BETWEEN ? AND ? LIMIT 1",
+                       (student_id, action, lo, hi)).fetchone() is not None
+
+
+def reconstruct(inputs, action, camera=None, workers=None, tolerance=0.5, analysis_fps=ANALYSIS_FPS,
+                segment_seconds=SEGMENT_SECONDS, window=DEDUP_SECONDS, dry_run=False, progress=None):
+    # inputs are (video path, start datetime). Returns one report row per
+    # event; status is 'logged', 'duplicate' (already in logs) or 'dry-run'.
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    tasks = []
+    for path, start in inputs:
+        tasks += [(task, start) for task in plan_segments(path, analysis_fps, segment_seconds)]
+    report = []
+    # Sightings from every input go on one wall-clock timeline before
+    # deduplicating, so overlapping or back-to-back recordings of the same
+    # gate (or one file given twice) yield each pass once. add_log is
+    # asynchronous, so the database check below cannot catch these.
+    sightings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "gallery")
+        export_snapshot(snapshot)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(process_segment, task, snapshot, tolerance) for task, _ in tasks]
+            for i, ((task, start), future) in enumerate(zip(tasks, futures)):
+                for sid, name, position, dist in future.result():
+                    sightings.append((sid, name, (start + datetime.timedelta(seconds=position)).timestamp(), dist,
+                                      task[0], position))
+                if progress is not None:
+                    progress(i + 1, len(tasks))
+    con = get_connection()
+    for event in dedupe_sightings(sightings, window):
+        path, position = event['source']
+        timestamp = datetime.datetime.fromtimestamp(event['position']).strftime(TIMESTAMP_FORMAT)
+        if _already_logged(con, event['student_id'], action, timestamp, window):
+            status = 'duplicate'
+        elif dry_run:
+            status = 'dry-run'
+        else:
+            add_log(event['student_id'], event['name'], action, timestamp=timestamp, camera=camera)
+            status = 'logged'
+        report.append({'timestamp': timestamp, 'student_id': event['student_id'], 'name': event['name'],
+                       'action': action, 'camera': camera, 'video': path,
+                       'position': round(position, 1), 'distance': round(event['distance'], 4),
+                       'status': status})
+    if not dry_run:
+        flush_logs()
+    return report
+
+
+def _parse_start(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a timestamp: {value!r} (use e.g. '2025-01-31 18:00:00')")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild attendance logs from recorded gate video.")
+    parser.add_argument("--input", nargs=2, action="append", required=True, metavar=("VIDEO", "START"),
+                        help="a video file and the wall-clock time of its first frame; repeat for more files")
+    parser.add_argument("--role", choices=("entry", "exit"), required=True)
+    parser.add_argument("--camera", default=None, help="camera name to record in the logs")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count - 1)")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--fps", type=float, default=ANALYSIS_FPS, help="frames analysed per second of video")
+    parser.add_argument("--dedup-seconds", type=float, default=DEDUP_SECONDS)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be logged")
+    parser.add_argument("--report", default=None, help="write the events to this CSV file")
+    args = parser.parse_args()
+    inputs = [(path, _parse_start(start)) for path, start in args.input]
+    init_db()
+    started = time.monotonic()
+
+    def progress(done, total):
+        print(f"\rProcessed {done}/{total} segments", end="", flush=True)
+
+    report = reconstruct(inputs, args.role, args.camera or f"batch-{args.role}", args.workers, args.tolerance,
+                         args.fps, window=args.dedup_seconds, dry_run=args.dry_run, progress=progress)
+    print()
+    if args.report:
+        with open(args.report, "w", newline="") as f:
+            writer = csv.DictWriter(f, REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(report)
+    else:
+        for row in report:
+            print(f"{row['timestamp']}  {row['action']:<5}  {row['name']} (id {row['student_id']})  "
+                  f"d={row['distance']}  {row['status']}")
+    video_seconds = sum(frames / fps for fps, frames in (video_info(path) for path, _ in inputs))
+    elapsed = time.monotonic() - started
+    counts = {}
+    for row in report:
+        counts[row['status']] = counts.get(row['status'], 0) + 1
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "no events"
+    print(f"{video_seconds:.0f}s of video in {elapsed:.1f}s ({video_seconds / max(elapsed, 1e-6):.1f}x realtime): "
+          f"{summary}")
+
+
+if __name__ == "__main__":
+    main()
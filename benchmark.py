@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+import itertools
+import subprocess
+import tracemalloc
+import numpy as np
+
+# Everything runs against a throwaway database and synthetic data, so the
+# numbers don't depend on (or touch) the real gallery, logs or cameras.
+GALLERY_SIZES = (100, 1000, 10000, 100000)
+# Cold-import groups for the startup stage. "app" is what every page of
+# main.py imports; the others are loaded only by the pages that need them.
+IMPORT_GROUPS = {
+    'app': "database, gallery, face_index, visitors, export, archive, metrics, enroll",
+    'streamlit': "streamlit",
+    'pandas': "pandas",
+    'matplotlib': "matplotlib.pyplot",
+    'vision': "face_utils",
+    'pipeline': "pipeline",
+}
+ENCODING_DIM = 128
+
+
+def percentiles(samples):
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {'n': len(ms), 'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99)), 'mean_ms': float(ms.mean()), 'max_ms': float(ms.max())}
+
+
+def timed(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    stats = percentiles(samples)
+    stats['per_s'] = float(len(samples) / sum(samples))
+    return stats
+
+
+def peak_memory(fn):
+    # Peak Python + NumPy allocation while fn runs once, in MiB. Measured in
+    # a separate run because tracemalloc slows the timed ones.
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20, result
+
+
+def synthetic_encodings(n, seed=0):
+    # Random vectors spread roughly like dlib encodings, where different
+    # people sit about 0.9 apart (sqrt(2 * 128) * 0.055).
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.055, (n, ENCODING_DIM)).astype(np.float32)
+
+
+def bench_matching(sizes, iterations, faces_per_frame=2):
+    from gallery import FaceGallery
+    from face_index import IVFIndex
+    results = {}
+    rng = np.random.default_rng(1)
+    for n in sizes:
+        matrix = synthetic_encodings(n)
+        students = [{'id': i, 'name': f"S{i}", 'room': None, 'encoding': matrix[i]} for i in range(n)]
+        picks = rng.integers(0, n, (iterations + 3, faces_per_frame))
+        queries = matrix[picks] + rng.normal(0, 0.02, picks.shape + (ENCODING_DIM,)).astype(np.float32)
+        entry = {}
+        mem, gallery = peak_memory(lambda: FaceGallery(students))
+        it = iter(queries)
+        entry['exact'] = timed(lambda: gallery.match(next(it)), iterations)
+        entry['exact']['build_peak_mib'] = mem
+        if n >= 10000:
+            index = IVFIndex().train(matrix)
+            mem, gallery = peak_memory(lambda: FaceGallery(students, index=index))
+            it = iter(queries)
+            entry['ivf'] = timed(lambda: gallery.match(next(it)), iterations)
+            entry['ivf']['build_peak_mib'] = mem
+        results[str(n)] = entry
+    return results
+
+
+def generate_video(path, seconds=10, fps=25, size=(1280, 720)):
+    # A moving bright block over a noisy background; enough to exercise
+    # decoding, the motion gate and MediaPipe without a camera.
+    import cv2
+    w, h = size
+    rng = np.random.default_rng(2)
+    background = (rng.random((h, w, 3)) * 180).astype(np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for i in range(seconds * fps):
+        frame = background.copy()
+        x = (i * 12) % (w - 240)
+        frame[h // 4:h // 4 + 300, x:x + 240] = 230
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def bench_vision(video, iterations):
+    # Detection and encoding need MediaPipe and dlib; without them the stage
+    # is reported as skipped rather than failing the whole run.
+    try:
+        import cv2
+        from face_utils import make_face_detector, detect_faces_mediapipe, encode_faces
+    except ImportError as e:
+        return {'skipped': f"{type(e).__name__}: {e}"}
+    from scheduler import FrameScheduler
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < iterations + 3:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        return {'skipped': f"could not read {video}"}
+    detector = make_face_detector()
+    scheduler = FrameScheduler()
+    h, w = frames[0].shape[:2]
+    box = (w // 3, h // 4, w // 3 + 200, h // 4 + 240)
+    results = {}
+
+    # RGB inputs are prepared up front, so the two detect stages time the
+    # detector alone, on the same frames, at full and at downscaled size.
+    full_rgb = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+    small_rgb = [cv2.cvtColor(scheduler.downscale(f), cv2.COLOR_BGR2RGB) for f in frames]
+
+    def each(fn):
+        # A fresh pass over the frame indices for every stage.
+        indices = (i % len(frames) for i in itertools.count())
+        return lambda: fn(next(indices))
+    results['decode_to_rgb'] = timed(each(lambda i: cv2.cvtColor(frames[i], cv2.COLOR_BGR2RGB)), iterations)
+    results['downscale_to_rgb'] = timed(
+        each(lambda i: cv2.cvtColor(scheduler.downscale(frames[i]), cv2.COLOR_BGR2RGB)), iterations)
+    results['motion_gate'] = timed(each(lambda i: scheduler.motion(frames[i])), iterations)
+    results['detect_full'] = timed(each(lambda i: detect_faces_mediapipe(frames[i], full_rgb[i], detector)),
+                                   iterations)
+    results['detect_downscaled'] = timed(
+        each(lambda i: detect_faces_mediapipe(frames[i], small_rgb[i], detector)), iterations)
+    results['encode_1_face'] = timed(each(lambda i: encode_faces(frames[i], [box])), max(5, iterations // 5),
+                                     warmup=1)
+    return results
+
+
+def synthetic_history(con, students=800, days=180, events_per_day=4, seed=3):
+    # Every student enters and leaves a few times a day over `days` days.
+    from database import encoding_to_blob, rebuild_presence
+    rng = np.random.default_rng(seed)
+    matrix = synthetic_encodings(students, seed)
+    rooms = [f"{'ABCD'[i % 4]}-{100 + i // 4 % 50}" for i in range(students)]
+    with con:
+        con.executemany("INSERT INTO students (id, name, roll, room, encoding) VALUES (?, ?, ?, ?, ?)",
+                        [(i + 1, f"Student {i + 1}", f"R{i + 1:05d}", rooms[i], encoding_to_blob(matrix[i]))
+                         for i in range(students)])
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    total = 0
+    for day in range(days):
+        base = start + datetime.timedelta(days=day)
+        n = students * events_per_day
+        sids = rng.integers(1, students + 1, n)
+        seconds = np.sort(rng.integers(6 * 3600, 23 * 3600, n))
+        rows = [(int(sid), f"Student {sid}", "entry" if k % 2 else "exit",
+                 (base.replace(hour=0, minute=0, second=0) + datetime.timedelta(seconds=int(s))).strftime(
+                     '%Y-%m-%d %H:%M:%S'), "bench")
+                for k, (sid, s) in enumerate(zip(sids, seconds))]
+        with con:
+            con.executemany("INSERT INTO logs (student_id, name, action, timestamp, camera) VALUES (?, ?, ?, ?, ?)",
+                            rows)
+        total += len(rows)
+    rebuild_presence()
+    return total
+
+
+def bench_database(iterations, log_rows, students, days):
+    import database
+    results = {}
+    con = database.get_connection()
+    t0 = time.perf_counter()
+    results['history_rows'] = synthetic_history(con, students, days)
+    results['history_build_s'] = time.perf_counter() - t0
+
+    # Log writes: single add_log calls as the cameras make them, then the
+    # time for the background writer to commit them all.
+    sids = np.random.default_rng(4).integers(1, students + 1, log_rows)
+    it = iter(sids.tolist() * 2)
+    results['add_log_enqueue'] = timed(lambda: database.add_log(next(it), "bench", "entry", camera="bench"),
+                                       log_rows, warmup=0)
+    t0 = time.perf_counter()
+    database.flush_logs(timeout=60)
+    results['add_log_flush_s'] = time.perf_counter() - t0
+    batch = [(int(s), "bench", "exit", datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "bench")
+             for s in sids[:100]]
+
+    def commit_batch():
+        with con:
+            database._insert_logs(con, batch)
+    results['commit_100_rows'] = timed(commit_batch, max(10, iterations // 10))
+
+    # Dashboard queries with the aggregate cache disabled, so every call
+    # does the real work.
+    database.AGGREGATE_TTL = 0.0
+    today = datetime.date.today()
+
+    def uncached(fn):
+        def run():
+            database._aggregate_cache.clear()
+            return fn()
+        return run
+    results['occupancy'] = timed(database.get_occupancy, iterations)
+    results['action_counts_today'] = timed(uncached(lambda: database.get_action_counts(today)), iterations)
+    results['hourly_counts_today'] = timed(uncached(lambda: database.get_hourly_counts(today)), iterations)
+    results['room_inside_counts'] = timed(uncached(database.get_room_inside_counts), iterations)
+    results['logs_first_page'] = timed(lambda: database.get_logs_page(100), iterations)
+    last = database.get_logs_page(100)[-1]
+    results['logs_deep_page'] = timed(lambda: database.get_logs_page(100, (last[5], last[0]), room="A-100"),
+                                      iterations)
+    mem, _ = peak_memory(database.get_occupancy)
+    results['occupancy']['peak_mib'] = mem
+    return results
+
+
+def bench_imports(repeats=5):
+    # Each group is imported in a fresh interpreter, so the numbers are
+    # cold-process import times (the cost Streamlit pays per server start,
+    # and what a page pays the first time it touches a lazy module).
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for group, modules in IMPORT_GROUPS.items():
+        code = f"import time; t = time.perf_counter(); import {modules}; print(time.perf_counter() - t)"
+        samples = []
+        for _ in range(repeats):
+            proc = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True)
+            if proc.returncode != 0:
+                results[group] = {'skipped': proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+                break
+            samples.append(float(proc.stdout.strip().splitlines()[-1]))
+        else:
+            results[group] = percentiles(samples)
+    return results
+
+
+def compare(old, new, prefix=""):
+    # Prints p50 changes between two result files, stage by stage.
+    for key in sorted(set(old) & set(new)):
+        a, b = old[key], new[key]
+        if isinstance(a, dict) and isinstance(b, dict):
+            if 'p50_ms' in a and 'p50_ms' in b:
+                change = (b['p50_ms'] - a['p50_ms']) / a['p50_ms'] * 100 if a['p50_ms'] else 0.0
+                print(f"{prefix}{key:<40} {a['p50_ms']:10.3f} -> {b['p50_ms']:10.3f} ms  ({change:+.1f}%)")
+            else:
+                compare(a, b, f"{prefix}{key}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recognition and logging hot paths on synthetic data.")
+    parser.add_argument("--sizes", default=",".join(map(str, GALLERY_SIZES)),
+                        help="comma-separated gallery sizes for the matching stage")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--video", default=None, help="sample video (default: a generated one)")
+    parser.add_argument("--log-rows", type=int, default=5000, help="add_log calls in the write stage")
+    parser.add_argument("--students", type=int, default=800)
+    parser.add_argument("--days", type=int, default=180, help="days of synthetic log history")
+    parser.add_argument("--stages", default="imports,matching,vision,database")
+    parser.add_argument("--out", default=None, help="write JSON here instead of stdout")
+    parser.add_argument("--compare", default=None, metavar="OLD_JSON", help="print p50 changes against a previous run")
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.DB_PATH = os.path.join(tmp, "bench.sqlite")
+        database.init_db()
+        report = {'meta': {
+            'started': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'args': vars(args),
+        }, 'stages': {}}
+        t0 = time.perf_counter()
+        if "imports" in stages:
+            report['stages']['imports'] = bench_imports()
+        if "matching" in stages:
+            sizes = [int(s) for s in args.sizes.split(",") if s]
+            report['stages']['matching'] = bench_matching(sizes, args.iterations)
+        if "vision" in stages:
+            video = args.video or generate_video(os.path.join(tmp, "sample.avi"))
+            report['stages']['vision'] = bench_vision(video, args.iterations)
+        if "database" in stages:
+            report['stages']['database'] = bench_database(args.iterations, args.log_rows, args.students, args.days)
+        report['meta']['elapsed_s'] = time.perf_counter() - t0
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        compare(old['stages'], report['stages'])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,57 @@
+import io
+import time
+import queue
+import logging
+import atexit
 import sqlite3
 import pickle
 import datetime
+import threading
+import numpy as np
+import metrics
+from image_utils import make_thumbnail
+
+DB_PATH = 'hostel_db.sqlite'
+
+# Encodings are stored as raw little-endian float32 (512 bytes for 128-d).
+# Schema 0 was a pickled float64 ndarray; init_db migrates those rows.
+ENCODING_SCHEMA = 1
+ENCODING_DTYPE = np.dtype('<f4')
+
+def encoding_to_blob(encoding):
+    return np.asarray(encoding, dtype=ENCODING_DTYPE).tobytes()
+
+def blob_to_encoding(blob):
+    return np.frombuffer(blob, dtype=ENCODING_DTYPE)
+
+class _LegacyEncodingUnpickler(pickle.Unpickler):
+    # Only what a pickled ndarray needs; anything else in an old row is refused.
+    ALLOWED = {
+        ('numpy', 'ndarray'), ('numpy', 'dtype'),
+        ('numpy.core.multiarray', '_reconstruct'), ('numpy._core.multiarray', '_reconstruct'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f"refusing to load {module}.{name} from a legacy encoding")
+        return super().find_class(module, name)
+
+_local = threading.local()
 
 def get_connection():
-    return sqlite3.connect('hostel_db.sqlite', check_same_thread=False)
+    # One long-lived connection per thread instead of a connect/close per
+    # call. WAL lets the dashboard read while the cameras write, and
+    # synchronous=NORMAL drops the per-commit fsync (WAL stays crash-safe).
+    con = getattr(_local, 'con', None)
+    if con is None:
+        con = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA busy_timeout=30000")
+        con.execute("PRAGMA temp_store=MEMORY")
+        con.execute("PRAGMA cache_size=-16000")
+        _local.con = con
+    return con
 
 def init_db():
     con = get_connection()
@@ -27,64 +75,593 @@ def init_db():
         timestamp TEXT
     )
     """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS student_tombstones (
+        student_id INTEGER PRIMARY KEY,
+        version INTEGER
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS presence (
+        student_id INTEGER PRIMARY KEY,
+        state TEXT,
+        last_event_ts TEXT,
+        last_camera TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS student_images (
+        student_id INTEGER PRIMARY KEY,
+        image BLOB
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS visitors (
+        id TEXT PRIMARY KEY,
+        first_seen TEXT,
+        last_seen TEXT,
+        hits INTEGER,
+        camera TEXT,
+        cameras TEXT,
+        actions TEXT,
+        snapshot TEXT,
+        thumbnail BLOB
+    )
+    """)
+    _ensure_column(cur, "students", "version", "INTEGER DEFAULT 0")
+    _ensure_column(cur, "students", "thumbnail", "BLOB")
+    _ensure_column(cur, "logs", "camera", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_students_version ON students(version)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_student_ts ON logs(student_id, timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_visitors_first_seen ON visitors(first_seen)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_visitors_camera ON visitors(camera, first_seen)")
+    cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('gallery_version', 0)")
+    cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('encoding_schema', 0)")
+    cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('presence_built', 0)")
+    cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('images_split', 0)")
     con.commit()
-    con.close()
+    migrate_encodings()
+    cur.execute("SELECT value FROM meta WHERE key='presence_built'")
+    if not cur.fetchone()[0]:
+        rebuild_presence()
+    cur.execute("SELECT value FROM meta WHERE key='images_split'")
+    if not cur.fetchone()[0]:
+        migrate_images()
 
-def add_student(name, roll, room, encoding, image_bytes):
+def migrate_images():
+    # Moves original photos out of the students table into student_images,
+    # so listing students never pages in image bytes, and builds thumbnails.
+    con = get_connection()
+    with con:
+        con.execute("""
+            INSERT OR REPLACE INTO student_images (student_id, image)
+            SELECT id, image FROM students WHERE image IS NOT NULL
+        """)
+        con.execute("UPDATE students SET image = NULL WHERE image IS NOT NULL")
+        con.execute("UPDATE meta SET value=1 WHERE key='images_split'")
+    return backfill_thumbnails()
+
+def backfill_thumbnails(batch_size=50):
+    # Builds thumbnails for students that don't have one yet.
+    con = get_connection()
+    built = 0
+    last_id = 0
+    while True:
+        rows = con.execute("""
+            SELECT i.student_id, i.image FROM student_images i JOIN students s ON s.id = i.student_id
+            WHERE s.thumbnail IS NULL AND i.image IS NOT NULL AND i.student_id > ?
+            ORDER BY i.student_id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return built
+        thumbs = []
+        for sid, image in rows:
+            try:
+                thumbs.append((make_thumbnail(image), sid))
+            except OSError:
+                logging.getLogger(__name__).warning("student %s has an unreadable photo", sid)
+        with con:
+            con.executemany("UPDATE students SET thumbnail=? WHERE id=?", thumbs)
+        built += len(thumbs)
+        last_id = rows[-1][0]
+
+def migrate_encodings():
+    # Rewrites schema-0 pickled encodings as float32 BLOBs in one transaction.
     con = get_connection()
     cur = con.cursor()
-    cur.execute("INSERT INTO students (name, roll, room, encoding, image) VALUES (?, ?, ?, ?, ?)",
-                (name, roll, room, pickle.dumps(encoding), image_bytes))
-    con.commit()
-    con.close()
+    cur.execute("SELECT value FROM meta WHERE key='encoding_schema'")
+    if cur.fetchone()[0] >= ENCODING_SCHEMA:
+        return 0
+    cur.execute("SELECT id, encoding FROM students WHERE encoding IS NOT NULL")
+    rows = [(encoding_to_blob(_LegacyEncodingUnpickler(io.BytesIO(blob)).load()), sid)
+            for sid, blob in cur.fetchall()]
+    with con:
+        cur.executemany("UPDATE students SET encoding=? WHERE id=?", rows)
+        cur.execute("UPDATE meta SET value=? WHERE key='encoding_schema'", (ENCODING_SCHEMA,))
+    return len(rows)
+
+def _ensure_column(cur, table, column, decl):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [r[1] for r in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _bump_gallery_version(cur):
+    # Every write path that changes what the cameras should recognise goes
+    # through here, inside the same transaction as the write itself.
+    cur.execute("UPDATE meta SET value = value + 1 WHERE key='gallery_version'")
+    cur.execute("SELECT value FROM meta WHERE key='gallery_version'")
+    return cur.fetchone()[0]
+
+def get_gallery_version():
+    con = get_connection()
+    cur = con.cursor()
+    cur.execute("SELECT value FROM meta WHERE key='gallery_version'")
+    r = cur.fetchone()
+    return r[0] if r else 0
+
+def get_gallery_delta(since_version=0):
+    # Returns (version, changed_students, removed_ids) for everything written
+    # after since_version. Only the columns matching needs are read, never
+    # the image BLOB.
+    con = get_connection()
+    cur = con.cursor()
+    cur.execute("SELECT value FROM meta WHERE key='gallery_version'")
+    version = cur.fetchone()[0]
+    if since_version > 0:
+        cur.execute("SELECT id, name, room, encoding FROM students WHERE version > ? AND version <= ?",
+                    (since_version, version))
+    else:
+        cur.execute("SELECT id, name, room, encoding FROM students")
+    changed = [{'id': r[0], 'name': r[1], 'room': r[2], 'encoding': blob_to_encoding(r[3])}
+               for r in cur.fetchall()]
+    removed = []
+    if since_version > 0:
+        cur.execute("SELECT student_id FROM student_tombstones WHERE version > ? AND version <= ?",
+                    (since_version, version))
+        removed = [r[0] for r in cur.fetchall()]
+    return version, changed, removed
+
+def add_student(name, roll, room, encoding, image_bytes):
+    # The thumbnail and blob are built before the transaction opens, so a bad
+    # photo fails without leaving the thread's connection mid-write.
+    blob, thumbnail = encoding_to_blob(encoding), make_thumbnail(image_bytes)
+    con = get_connection()
+    with con:
+        cur = con.cursor()
+        version = _bump_gallery_version(cur)
+        cur.execute("INSERT INTO students (name, roll, room, encoding, thumbnail, version) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, roll, room, blob, thumbnail, version))
+        cur.execute("INSERT INTO student_images (student_id, image) VALUES (?, ?)", (cur.lastrowid, image_bytes))
+    return cur.lastrowid
+
+def add_students_bulk(students):
+    # students yields (name, roll, room, encoding, image_bytes, thumbnail);
+    # thumbnail may be None. Everything goes in one transaction under a
+    # single gallery version, so cameras pick the batch up as one delta.
+    rows = [(name, roll, room, encoding_to_blob(encoding), thumbnail or make_thumbnail(image_bytes), image_bytes)
+            for name, roll, room, encoding, image_bytes, thumbnail in students]
+    con = get_connection()
+    ids = []
+    with con:
+        cur = con.cursor()
+        version = _bump_gallery_version(cur)
+        for name, roll, room, blob, thumbnail, image_bytes in rows:
+            cur.execute("""
+                INSERT INTO students (name, roll, room, encoding, thumbnail, version) VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, roll, room, blob, thumbnail, version))
+            cur.execute("INSERT INTO student_images (student_id, image) VALUES (?, ?)", (cur.lastrowid, image_bytes))
+            ids.append(cur.lastrowid)
+    return ids
 
 def get_all_students():
     con = get_connection()
     cur = con.cursor()
-    cur.execute("SELECT id, name, roll, room, encoding, image FROM students")
+    cur.execute("SELECT id, name, roll, room, encoding FROM students")
     rows = cur.fetchall()
     students = []
     for r in rows:
         students.append({
-            'id': r[0], 'name': r[1], 'roll': r[2], 'room': r[3], 'encoding': pickle.loads(r[4]), 'image': r[5]
+            'id': r[0], 'name': r[1], 'roll': r[2], 'room': r[3], 'encoding': blob_to_encoding(r[4])
         })
-    con.close()
     return students
 
-def add_log(student_id, name, action):
+def get_students_by_room(room):
+    # Listing data only: the thumbnail, never the original photo.
+    cur = get_connection().cursor()
+    cur.execute("SELECT id, name, roll, room, thumbnail FROM students WHERE room = ? ORDER BY id", (room,))
+    return [{'id': r[0], 'name': r[1], 'roll': r[2], 'room': r[3], 'thumbnail': r[4]} for r in cur.fetchall()]
+
+def get_student_image(student_id):
+    cur = get_connection().cursor()
+    cur.execute("SELECT image FROM student_images WHERE student_id = ?", (student_id,))
+    r = cur.fetchone()
+    return r[0] if r else None
+
+def add_log(student_id, name, action, timestamp=None, camera=None):
+    # Queued for the background writer so camera threads never wait on a
+    # commit. The timestamp is taken now, not when the batch is flushed.
+    if timestamp is None:
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    _get_log_writer().put((student_id, name, action, timestamp, camera))
+
+def flush_logs(timeout=5.0):
+    # Blocks until every add_log queued so far is committed.
+    if _log_writer is not None:
+        _log_writer.flush(timeout)
+
+def pending_logs():
+    # Rows queued for the log writer and not yet committed.
+    return _log_writer._queue.qsize() if _log_writer is not None else 0
+
+class LogWriter(threading.Thread):
+    # Groups add_log calls into one transaction per batch. A batch is written
+    # when it reaches max_batch rows or flush_interval seconds after its
+    # first row, whichever comes first.
+    def __init__(self, flush_interval=0.2, max_batch=500, max_pending=10000):
+        super().__init__(name="log-writer", daemon=True)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def put(self, row):
+        self._queue.put(row)
+
+    def flush(self, timeout=5.0):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for w in waiters:
+                    w.set()
+
+    def _write(self, batch, attempts=3):
+        # Never raises: if this thread died, add_log would block forever once
+        # the queue filled, and every camera with it.
+        for attempt in range(attempts):
+            try:
+                con = get_connection()
+                with metrics.timer("log_commit_seconds"), con:
+                    _insert_logs(con, batch)
+                metrics.observe("log_batch_rows", len(batch))
+                return
+            except sqlite3.OperationalError:
+                # Locked or busy database: worth retrying.
+                if attempt == attempts - 1:
+                    logging.getLogger(__name__).exception("dropping %d log rows after %d attempts",
+                                                          len(batch), attempts)
+                else:
+                    time.sleep(0.5)
+            except Exception:
+                logging.getLogger(__name__).exception("dropping %d log rows", len(batch))
+                return
+
+def _insert_logs(con, rows):
+    # rows are (student_id, name, action, timestamp, camera). Presence is
+    # updated in the same transaction; an event older than the one already
+    # recorded (e.g. a late backfill) leaves the current state alone.
+    con.executemany("INSERT INTO logs (student_id, name, action, timestamp, camera) VALUES (?, ?, ?, ?, ?)", rows)
+    _upsert_presence(con, [(r[0], r[2], r[3], r[4]) for r in rows if r[0] is not None and r[2] in ('entry', 'exit')])
+
+def _upsert_presence(con, events):
+    # events are (student_id, action, timestamp, camera).
+    con.executemany("""
+        INSERT INTO presence (student_id, state, last_event_ts, last_camera) VALUES (?, ?, ?, ?)
+        ON CONFLICT(student_id) DO UPDATE SET
+            state=excluded.state, last_event_ts=excluded.last_event_ts, last_camera=excluded.last_camera
+        WHERE excluded.last_event_ts >= presence.last_event_ts
+    """, events)
+
+def rebuild_presence(include_archive=True):
+    # Recomputes presence from the full log history. Students whose last
+    # event has been moved to the archive (archive.py) are taken from there.
+    archived = []
+    if include_archive:
+        from archive import last_archived_events
+        archived = last_archived_events()
+    con = get_connection()
+    with con:
+        con.execute("DELETE FROM presence")
+        con.execute("""
+            INSERT INTO presence (student_id, state, last_event_ts, last_camera)
+            SELECT student_id, action, timestamp, camera FROM (
+                SELECT student_id, action, timestamp, camera,
+                       ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY timestamp DESC, id DESC) AS rn
+                FROM logs WHERE student_id IS NOT NULL AND action IN ('entry', 'exit')
+            ) WHERE rn = 1
+        """)
+        _upsert_presence(con, archived)
+        con.execute("UPDATE meta SET value=1 WHERE key='presence_built'")
+    return con.execute("SELECT COUNT(*) FROM presence").fetchone()[0]
+
+def get_occupancy():
+    # Every student with their current state ('entry' = inside), in one query.
     con = get_connection()
     cur = con.cursor()
-    cur.execute("INSERT INTO logs (student_id, name, action, timestamp) VALUES (?, ?, ?, ?)",
-                (student_id, name, action, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    con.commit()
-    con.close()
+    cur.execute("""
+        SELECT s.id, s.name, s.roll, s.room, p.state, p.last_event_ts, p.last_camera
+        FROM students s LEFT JOIN presence p ON p.student_id = s.id
+    """)
+    return [{'id': r[0], 'name': r[1], 'roll': r[2], 'room': r[3], 'state': r[4],
+             'last_event_ts': r[5], 'last_camera': r[6]} for r in cur.fetchall()]
+
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+def _get_log_writer():
+    global _log_writer
+    if _log_writer is None:
+        with _log_writer_lock:
+            if _log_writer is None:
+                writer = LogWriter()
+                writer.start()
+                metrics.gauge("log_queue_depth", writer._queue.qsize)
+                atexit.register(writer.flush)
+                _log_writer = writer
+    return _log_writer
 
 def get_logs():
     con = get_connection()
     cur = con.cursor()
-    cur.execute("SELECT * FROM logs ORDER BY timestamp DESC")
+    cur.execute("SELECT id, student_id, name, action, timestamp FROM logs ORDER BY timestamp DESC")
     rows = cur.fetchall()
-    con.close()
     return rows
 
+# Dashboard aggregates. Results are cached per argument set and keyed on the
+# latest log id (and the gallery version where students matter): within
+# AGGREGATE_TTL seconds a repeat call costs nothing, after that it costs one
+# MAX(id) lookup unless new logs arrived.
+AGGREGATE_TTL = 1.0
+_aggregate_cache = {}
+_aggregate_lock = threading.Lock()
+
+def get_latest_log_id():
+    con = get_connection()
+    cur = con.cursor()
+    cur.execute("SELECT MAX(id) FROM logs")
+    return cur.fetchone()[0] or 0
+
+def _cached_aggregate(key, compute, students=False):
+    # students=True for aggregates that also read the students table: they
+    # are recomputed when the gallery version moves (edits, deletes) too.
+    now = time.monotonic()
+    with _aggregate_lock:
+        hit = _aggregate_cache.get(key)
+    if hit and now - hit[1] < AGGREGATE_TTL:
+        return hit[2]
+    latest = (get_latest_log_id(), get_gallery_version()) if students else get_latest_log_id()
+    if hit and hit[0] == latest:
+        value = hit[2]
+    else:
+        value = compute()
+    with _aggregate_lock:
+        _aggregate_cache[key] = (latest, now, value)
+    return value
+
+def day_range(start, end=None):
+    # Inclusive date range -> [start 00:00:00, day after end 00:00:00)
+    start = datetime.date.fromisoformat(str(start)[:10])
+    end = datetime.date.fromisoformat(str(end)[:10]) if end is not None else start
+    return start.strftime('%Y-%m-%d 00:00:00'), (end + datetime.timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+
+def get_action_counts(start, end=None):
+    # {action: count} for logs between the start and end dates (inclusive).
+    lo, hi = day_range(start, end)
+    def compute():
+        cur = get_connection().cursor()
+        cur.execute("SELECT action, COUNT(*) FROM logs WHERE timestamp >= ? AND timestamp < ? GROUP BY action",
+                    (lo, hi))
+        return dict(cur.fetchall())
+    return _cached_aggregate(('action_counts', lo, hi), compute)
+
+def get_hourly_counts(start, end=None, action=None):
+    # [(hour 'YYYY-MM-DD HH', action, count)] ordered by hour.
+    lo, hi = day_range(start, end)
+    def compute():
+        cur = get_connection().cursor()
+        sql = ("SELECT substr(timestamp, 1, 13) AS hour, action, COUNT(*) FROM logs "
+               "WHERE timestamp >= ? AND timestamp < ?")
+        params = [lo, hi]
+        if action is not None:
+            sql += " AND action = ?"
+            params.append(action)
+        cur.execute(sql + " GROUP BY hour, action ORDER BY hour", params)
+        return cur.fetchall()
+    return _cached_aggregate(('hourly_counts', lo, hi, action), compute)
+
+def get_room_inside_counts():
+    # {room: students currently inside}, from the presence table.
+    def compute():
+        cur = get_connection().cursor()
+        cur.execute("""
+            SELECT s.room, COUNT(*) FROM presence p JOIN students s ON s.id = p.student_id
+            WHERE p.state = 'entry' GROUP BY s.room
+        """)
+        return dict(cur.fetchall())
+    return _cached_aggregate(('room_inside_counts',), compute, students=True)
+
+LOG_COLUMNS = ["ID", "Student ID", "Name", "Room", "Action", "Timestamp", "Camera"]
+
+def _log_filters(start=None, end=None, student=None, room=None, action=None):
+    # student may be an id or a (partial) name.
+    clauses, params = [], []
+    if start is not None or end is not None:
+        lo, hi = day_range(start or end, end or start)
+        clauses.append("l.timestamp >= ? AND l.timestamp < ?")
+        params += [lo, hi]
+    if isinstance(student, int):
+        clauses.append("l.student_id = ?")
+        params.append(student)
+    elif student:
+        clauses.append("l.name LIKE ?")
+        params.append(f"%{student}%")
+    if room:
+        clauses.append("l.student_id IN (SELECT id FROM students WHERE room = ?)")
+        params.append(room)
+    if action:
+        clauses.append("l.action = ?")
+        params.append(action)
+    return clauses, params
+
+def get_logs_page(limit=50, before=None, **filters):
+    # Newest first. `before` is the (timestamp, id) of the last row of the
+    # previous page, so every page is an index seek rather than an OFFSET scan.
+    clauses, params = _log_filters(**filters)
+    if before is not None:
+        clauses.append("(l.timestamp < ? OR (l.timestamp = ? AND l.id < ?))")
+        params += [before[0], before[0], before[1]]
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    cur = get_connection().cursor()
+    cur.execute(f"""
+        SELECT l.id, l.student_id, l.name, s.room, l.action, l.timestamp, l.camera
+        FROM logs l LEFT JOIN students s ON s.id = l.student_id
+        {where} ORDER BY l.timestamp DESC, l.id DESC LIMIT ?
+    """, params + [limit])
+    return cur.fetchall()
+
+def iter_logs(chunk_size=5000, **filters):
+    # Yields lists of log rows (newest first) without holding them all.
+    before = None
+    while True:
+        rows = get_logs_page(chunk_size, before, **filters)
+        if not rows:
+            return
+        yield rows
+        before = (rows[-1][5], rows[-1][0])
+
+def get_rooms():
+    cur = get_connection().cursor()
+    cur.execute("SELECT DISTINCT room FROM students WHERE room IS NOT NULL")
+    return [r[0] for r in cur.fetchall()]
+
+def upsert_visitors(con, records, snapshots=()):
+    # records are dicts from visitors.Visitor.record(); snapshots are
+    # (visitor id, snapshot path, thumbnail bytes). The first camera that saw
+    # a visitor is kept in `camera` for the indexed filter.
+    con.executemany("""
+        INSERT INTO visitors (id, first_seen, last_seen, hits, camera, cameras, actions)
+        VALUES (:id, :first_seen, :last_seen, :hits, :camera, :cameras, :actions)
+        ON CONFLICT(id) DO UPDATE SET
+            last_seen=excluded.last_seen, hits=excluded.hits, cameras=excluded.cameras, actions=excluded.actions
+    """, [dict(r, camera=r['cameras'][0] if r['cameras'] else None, cameras=",".join(r['cameras']),
+               actions=",".join(r['actions'])) for r in records])
+    con.executemany("UPDATE visitors SET snapshot=?, thumbnail=? WHERE id=?",
+                    [(path, thumb, vid) for vid, path, thumb in snapshots])
+
+def _visitor_filters(start=None, end=None, camera=None):
+    clauses, params = [], []
+    if start is not None or end is not None:
+        lo, hi = day_range(start or end, end or start)
+        clauses.append("first_seen >= ? AND first_seen < ?")
+        params += [lo, hi]
+    if camera:
+        clauses.append("camera = ?")
+        params.append(camera)
+    return clauses, params
+
+def get_visitors_page(limit=30, before=None, **filters):
+    # Newest first, keyset-paginated on (first_seen, id) like get_logs_page.
+    # Rows are (id, first_seen, last_seen, hits, camera, cameras, actions, thumbnail).
+    clauses, params = _visitor_filters(**filters)
+    if before is not None:
+        clauses.append("(first_seen < ? OR (first_seen = ? AND id < ?))")
+        params += [before[0], before[0], before[1]]
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    cur = get_connection().cursor()
+    cur.execute(f"""
+        SELECT id, first_seen, last_seen, hits, camera, cameras, actions, thumbnail FROM visitors
+        {where} ORDER BY first_seen DESC, id DESC LIMIT ?
+    """, params + [limit])
+    return cur.fetchall()
+
+def count_visitors(start, end=None, camera=None):
+    clauses, params = _visitor_filters(start, end, camera)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    cur = get_connection().cursor()
+    cur.execute(f"SELECT COUNT(*) FROM visitors {where}", params)
+    return cur.fetchone()[0]
+
+def get_visitor_cameras():
+    cur = get_connection().cursor()
+    cur.execute("SELECT DISTINCT camera FROM visitors WHERE camera IS NOT NULL")
+    return [r[0] for r in cur.fetchall()]
+
 def get_last_action(student_id):
     con = get_connection()
     cur = con.cursor()
-    cur.execute("SELECT action FROM logs WHERE student_id=? ORDER BY timestamp DESC LIMIT 1", (student_id,))
+    cur.execute("SELECT state FROM presence WHERE student_id=?", (student_id,))
     r = cur.fetchone()
-    con.close()
     if r:
         return r[0]
     return None
 
-def update_student(student_id, name, roll, room, image_bytes=None):
+def update_student(student_id, name, roll, room, image_bytes=None, encoding=None):
+    thumbnail = make_thumbnail(image_bytes) if image_bytes is not None else None
+    blob = encoding_to_blob(encoding) if encoding is not None else None
     con = get_connection()
-    cur = con.cursor()
-    if image_bytes is not None:
-        cur.execute("UPDATE students SET name=?, roll=?, room=?, image=? WHERE id=?",
-                    (name, roll, room, image_bytes, student_id))
-    else:
-        cur.execute("UPDATE students SET name=?, roll=?, room=? WHERE id=?",
-                    (name, roll, room, student_id))
-    con.commit()
-    con.close()
+    with con:
+        cur = con.cursor()
+        version = _bump_gallery_version(cur)
+        if image_bytes is not None:
+            cur.execute("UPDATE students SET name=?, roll=?, room=?, thumbnail=?, version=? WHERE id=?",
+                        (name, roll, room, thumbnail, version, student_id))
+            cur.execute("INSERT OR REPLACE INTO student_images (student_id, image) VALUES (?, ?)",
+                        (student_id, image_bytes))
+        else:
+            cur.execute("UPDATE students SET name=?, roll=?, room=?, version=? WHERE id=?",
+                        (name, roll, room, version, student_id))
+        if blob is not None:
+            cur.execute("UPDATE students SET encoding=? WHERE id=?", (blob, student_id))
+
+def delete_student(student_id):
+    con = get_connection()
+    with con:
+        cur = con.cursor()
+        version = _bump_gallery_version(cur)
+        cur.execute("DELETE FROM students WHERE id=?", (student_id,))
+        cur.execute("DELETE FROM presence WHERE student_id=?", (student_id,))
+        cur.execute("DELETE FROM student_images WHERE student_id=?", (student_id,))
+        cur.execute("INSERT OR REPLACE INTO student_tombstones (student_id, version) VALUES (?, ?)",
+                    (student_id, version))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Database maintenance commands.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-presence", help="recompute who is inside from the full log history, archive included")
+    sub.add_parser("backfill-thumbnails", help="build missing student thumbnails")
+    args = parser.parse_args()
+    init_db()
+    if args.command == "rebuild-presence":
+        print(f"Rebuilt presence for {rebuild_presence()} students")
+    elif args.command == "backfill-thumbnails":
+        print(f"Built {backfill_thumbnails()} thumbnails")
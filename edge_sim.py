@@ -0,0 +1,130 @@
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+import numpy as np
+from benchmark import percentiles, synthetic_encodings
+from database import init_db, get_gallery_delta
+from gallery import FaceGallery
+from ingest_server import encode_batch, PORT, TOKEN_HEADER
+
+
+def known_encodings():
+    # Enrolled faces from the local database, if this machine has one, so
+    # part of the load matches and exercises the logging path.
+    init_db()
+    _, students, _ = get_gallery_delta(0)
+    return np.asarray(FaceGallery(students).matrix, dtype=np.float32)
+
+
+class Edge(threading.Thread):
+    # One simulated gate box: a single keep-alive connection sending a batch
+    # every 1/rate seconds (or back to back when rate is 0).
+    def __init__(self, name, url, action, pool, batch, rate, until, dtype, token=None, seed=0):
+        super().__init__(name=name, daemon=True)
+        self.seed = seed
+        self.url = url
+        self.action = action
+        self.pool = pool
+        self.batch = batch
+        self.interval = 1.0 / rate if rate else 0.0
+        self.until = until
+        self.dtype = dtype
+        self.headers = {"Content-Type": "application/octet-stream"}
+        if token:
+            self.headers[TOKEN_HEADER] = token
+        self.latencies = []
+        self.statuses = {}
+        self.embeddings = 0
+        self.logged = 0
+
+    def _connect(self):
+        return http.client.HTTPConnection(self.url.hostname, self.url.port or PORT, timeout=10)
+
+    def run(self):
+        rng = np.random.default_rng(self.seed)
+        conn = self._connect()
+        next_send = time.monotonic()
+        while time.monotonic() < self.until:
+            picks = self.pool[rng.integers(0, len(self.pool), self.batch)]
+            vectors = picks + rng.normal(0, 0.01, picks.shape).astype(np.float32)
+            body = encode_batch(self.name, self.action, np.full(self.batch, time.time()), vectors, self.dtype)
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/v1/embeddings", body, self.headers)
+                response = conn.getresponse()
+                payload = response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = self._connect()
+                status = "error"
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200:
+                self.latencies.append(time.perf_counter() - t0)
+                self.embeddings += self.batch
+                self.logged += sum(r['logged'] for r in json.loads(payload)['results'])
+            elif status in (503, "error"):
+                time.sleep(0.05)
+            if self.interval:
+                next_send += self.interval
+                time.sleep(max(0.0, next_send - time.monotonic()))
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test ingest_server.py with simulated edge cameras.")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{PORT}")
+    parser.add_argument("--edges", type=int, default=8, help="simulated edge boxes (one connection each)")
+    parser.add_argument("--batch", type=int, default=16, help="embeddings per request")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second per edge (0: as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--role", choices=("entry", "exit"), default="entry")
+    parser.add_argument("--known", type=float, default=0.5,
+                        help="share of embeddings drawn from enrolled faces in the local database")
+    parser.add_argument("--float32", action="store_true", help="send float32 instead of float16 vectors")
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--out", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    known = known_encodings()
+    n_known = int(round(1000 * args.known)) if len(known) else 0
+    pool = synthetic_encodings(1000 - n_known, seed=7)
+    if n_known:
+        pool = np.concatenate([known[np.arange(n_known) % len(known)], pool])
+    url = urlparse(args.url)
+    until = time.monotonic() + args.duration
+    dtype = np.float32 if args.float32 else np.float16
+    edges = [Edge(f"edge-{i + 1}", url, args.role, pool, args.batch, args.rate, until, dtype, args.token, i)
+             for i in range(args.edges)]
+    started = time.monotonic()
+    for edge in edges:
+        edge.start()
+    for edge in edges:
+        edge.join()
+    elapsed = time.monotonic() - started
+
+    latencies = [x for edge in edges for x in edge.latencies]
+    statuses = {}
+    for edge in edges:
+        for status, n in edge.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + n
+    report = {
+        'args': vars(args), 'elapsed_s': elapsed, 'statuses': statuses,
+        'requests_per_s': len(latencies) / elapsed,
+        'embeddings_per_s': sum(edge.embeddings for edge in edges) / elapsed,
+        'logged': sum(edge.logged for edge in edges),
+        'latency': percentiles(latencies) if latencies else None,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import time
+import datetime
+import threading
+import collections
+import cv2
+import metrics
+from pipeline import CameraPipeline
+
+PREVIEW_FPS = 10
+JPEG_QUALITY = 70
+
+
+class CameraEngine:
+    # One recognition pipeline per camera per process, shared by every
+    # session that watches it. Capture and recognition run once; viewers read
+    # the latest annotated JPEG from a single-slot buffer and the recent
+    # events from a bounded log, so a slow or extra viewer costs one JPEG
+    # copy, not another capture loop. Previews are encoded at most
+    # preview_fps times a second, whatever the recognition rate.
+    def __init__(self, source, action, gallery, executor=None, camera=None, box_color=(0, 200, 83),
+                 preview_fps=PREVIEW_FPS, jpeg_quality=JPEG_QUALITY, idle_timeout=10.0, max_events=100):
+        self.source = source
+        self.action = action
+        self.gallery = gallery
+        self.executor = executor
+        self.camera = camera or f"webcam-{action}"
+        self.box_color = box_color
+        self.preview_interval = 1.0 / preview_fps
+        self.jpeg_quality = jpeg_quality
+        # With no viewers for this long the engine stops and frees the camera.
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_seq = 0
+        self._events = collections.deque(maxlen=max_events)
+        self._event_id = 0
+        self._viewers = 0
+        self._idle_since = time.monotonic()
+        self._announced = set()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.pipeline = None
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def start(self):
+        self.pipeline = CameraPipeline(self.source, self.action, self.gallery, executor=self.executor,
+                                       camera=self.camera).start()
+        metrics.gauge("viewers", lambda: self._viewers, camera=self.camera)
+        self._preview_fps = metrics.rate("preview_fps", camera=self.camera)
+        self._thread = threading.Thread(target=self._run, name=f"engine-{self.camera}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def subscribe(self):
+        # Returns the latest event id, so a new viewer only sees what happens
+        # after it joined, or None if the engine has already stopped.
+        with self._cond:
+            if self._stopped.is_set():
+                return None
+            self._viewers += 1
+            return self._event_id
+
+    def unsubscribe(self):
+        with self._cond:
+            self._viewers = max(0, self._viewers - 1)
+            if self._viewers == 0:
+                self._idle_since = time.monotonic()
+
+    def frame(self, after_seq=0, timeout=1.0):
+        # (seq, jpeg bytes) newer than after_seq, or None on timeout.
+        with self._cond:
+            if self._frame_seq <= after_seq and not self._stopped.is_set():
+                self._cond.wait(timeout)
+            if self._frame is None or self._frame_seq <= after_seq:
+                return None
+            return self._frame_seq, self._frame
+
+    def events(self, after_id=0):
+        # Events newer than after_id, oldest first; each is a dict with an 'id'.
+        with self._cond:
+            return [e for e in self._events if e['id'] > after_id]
+
+    def _publish_event(self, kind, face):
+        self._event_id += 1
+        self._events.append({'id': self._event_id, 'kind': kind, 'name': face['name'],
+                             'student_id': face['student_id'], 'action': self.action,
+                             'time': datetime.datetime.now().strftime('%H:%M:%S')})
+
+    def _run(self):
+        last_preview = 0.0
+        last_seq = 0
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    if not self._viewers and time.monotonic() - self._idle_since > self.idle_timeout:
+                        self._stopped.set()
+                        break
+                result = self.pipeline.results.get(timeout=0.5)
+                if result is None:
+                    if not self.pipeline.alive:
+                        break
+                    continue
+                if result['seq'] < last_seq:
+                    continue
+                last_seq = result['seq']
+                with self._cond:
+                    for face in result['faces']:
+                        if face['logged']:
+                            self._publish_event('logged', face)
+                        elif face['student_id'] is None and face['track_id'] not in self._announced:
+                            self._announced.add(face['track_id'])
+                            self._publish_event('unknown', face)
+                    if len(self._announced) > 1000:
+                        self._announced.clear()
+                now = time.monotonic()
+                if now - last_preview < self.preview_interval:
+                    continue
+                last_preview = now
+                frame = result['frame'].copy()
+                for face in result['faces']:
+                    x1, y1, x2, y2 = face['box']
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), self.box_color, 2)
+                ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    continue
+                with self._cond:
+                    self._frame_seq += 1
+                    self._frame = jpeg.tobytes()
+                    self._cond.notify_all()
+                self._preview_fps.mark()
+        finally:
+            self.pipeline.stop()
+            self._stopped.set()
+            with self._cond:
+                self._cond.notify_all()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(action, gallery, executor=None, source=0, **kwargs):
+    # Subscribes to the running engine for this camera, starting it on first
+    # use or restarting it if it has stopped (no viewers, or the source went
+    # away). Returns (engine, last event id); call engine.unsubscribe() when done.
+    with _engines_lock:
+        engine = _engines.get(action)
+        if engine is not None:
+            last_event = engine.subscribe()
+            if last_event is not None:
+                return engine, last_event
+            # Let the old pipeline release the camera before reopening it.
+            engine.stop()
+        engine = CameraEngine(source, action, gallery, executor=executor, **kwargs).start()
+        _engines[action] = engine
+        return engine, engine.subscribe()
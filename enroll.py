@@ -0,0 +1,243 @@
+import io
+import os
+import csv
+import time
+import zipfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from database import init_db, add_students_bulk, get_all_students
+from gallery import FaceGallery
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Photos are shrunk to this many pixels on the long side before detection;
+# enrollment photos are portraits, so this keeps the face well above the
+# size dlib needs while making HOG detection several times faster.
+MAX_PHOTO_SIDE = 1024
+# A new face this close to an enrolled one (or to another row in the same
+# batch) is probably the same person enrolled twice.
+DUPLICATE_DISTANCE = 0.45
+REPORT_COLUMNS = ["row", "name", "roll", "room", "photo", "status", "reason", "match_id", "match_name", "distance"]
+
+
+class PhotoSource:
+    # Photos from a directory or a zip archive, looked up by file name or by
+    # file name without extension (so a manifest can just give the roll).
+    def __init__(self, path_or_file):
+        self._zip = None
+        self._dir = None
+        if isinstance(path_or_file, str) and os.path.isdir(path_or_file):
+            self._dir = path_or_file
+            names = [os.path.relpath(os.path.join(root, f), path_or_file)
+                     for root, _, files in os.walk(path_or_file) for f in files]
+        else:
+            self._zip = zipfile.ZipFile(path_or_file)
+            names = [n for n in self._zip.namelist() if not n.endswith("/")]
+        self._names = {}
+        for name in names:
+            base = os.path.basename(name)
+            if base.startswith(".") or not base.lower().endswith(PHOTO_EXTENSIONS):
+                continue
+            self._names.setdefault(base.lower(), name)
+            self._names.setdefault(os.path.splitext(base)[0].lower(), name)
+
+    def find(self, key):
+        return self._names.get(str(key).strip().lower()) if key else None
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self._dir, name), "rb") as f:
+            return f.read()
+
+
+def read_manifest(fileobj):
+    # CSV with name, roll and room columns and an optional photo column.
+    # Without one, each row's photo is the file named after its roll number.
+    text = fileobj.read()
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {f.strip().lower(): f for f in reader.fieldnames or []}
+    missing = [c for c in ("name", "roll", "room") if c not in fields]
+    if missing:
+        raise ValueError(f"manifest is missing column(s): {', '.join(missing)}")
+    rows = []
+    for line_no, rec in enumerate(reader, start=2):
+        row = {c: (rec.get(fields[c]) or "").strip() for c in ("name", "roll", "room")}
+        row['photo'] = (rec.get(fields['photo']) or "").strip() if 'photo' in fields else ""
+        row['row'] = line_no
+        rows.append(row)
+    return rows
+
+
+def encode_photo(image_bytes, max_side=MAX_PHOTO_SIDE):
+    # Runs in a worker process. Returns (reason, encoding, thumbnail); reason
+    # is None when the photo has exactly one face.
+    import face_recognition
+    from PIL import Image, ImageOps
+    from image_utils import make_thumbnail
+    # One odd photo (a decompression bomb, a dlib error) is a rejected row,
+    # not the end of the batch.
+    try:
+        try:
+            image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGB")
+        except OSError:
+            return "unreadable image", None, None
+        image.thumbnail((max_side, max_side))
+        img_np = np.array(image)
+        locations = face_recognition.face_locations(img_np)
+        if not locations:
+            return "no face found", None, None
+        if len(locations) > 1:
+            return f"{len(locations)} faces found", None, None
+        encoding = face_recognition.face_encodings(img_np, locations)[0]
+        return None, encoding, make_thumbnail(image_bytes)
+    except Exception as e:
+        return f"encoding failed: {type(e).__name__}: {e}", None, None
+
+
+def _encode_all(jobs, source, workers, progress):
+    # jobs are (row, photo name). At most a few photos per worker are in
+    # flight, so memory stays flat however large the batch is.
+    results = {}
+    total = len(jobs)
+    pending = {}
+    todo = iter(jobs)
+    # Spawned, since the Streamlit page calling this runs other threads.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        while True:
+            while len(pending) < workers * 4:
+                job = next(todo, None)
+                if job is None:
+                    break
+                row, photo = job
+                try:
+                    pending[executor.submit(encode_photo, source.read(photo))] = row['row']
+                except Exception as e:
+                    results[row['row']] = (f"unreadable photo: {type(e).__name__}: {e}", None, None)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                row_no = pending.pop(future)
+                try:
+                    results[row_no] = future.result()
+                except Exception as e:
+                    # e.g. a worker process killed by a crash in native code
+                    results[row_no] = (f"encoding failed: {type(e).__name__}: {e}", None, None)
+            if progress is not None:
+                progress(len(results), total)
+    return results
+
+
+def enroll(rows, source, workers=None, duplicate_distance=DUPLICATE_DISTANCE, allow_duplicates=False,
+           dry_run=False, progress=None):
+    # Returns one report entry per manifest row; status is 'enrolled',
+    # 'rejected' or 'duplicate' (or 'ok' in a dry run).
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    report = []
+    jobs = []
+    for row in rows:
+        entry = dict(row, status=None, reason=None, match_id=None, match_name=None, distance=None)
+        report.append(entry)
+        photo = source.find(row['photo']) or source.find(row['roll'])
+        entry['photo'] = photo or row['photo']
+        if not (row['name'] and row['roll'] and row['room']):
+            entry['status'], entry['reason'] = 'rejected', "name, roll and room are required"
+        elif photo is None:
+            entry['status'], entry['reason'] = 'rejected', "photo not found"
+        else:
+            jobs.append((row, photo))
+    results = _encode_all(jobs, source, workers, progress)
+
+    students = get_all_students()
+    gallery = FaceGallery(students)
+    enrolled_rolls = {s['roll'] for s in students}
+    accepted = []
+    for entry in report:
+        if entry['status'] is not None:
+            continue
+        reason, encoding, thumbnail = results[entry['row']]
+        if reason is not None:
+            entry['status'], entry['reason'] = 'rejected', reason
+            continue
+        entry['encoding'], entry['thumbnail'] = encoding, thumbnail
+        accepted.append(entry)
+
+    # Nearest neighbour against the enrolled gallery, then within the batch.
+    if accepted:
+        matrix = np.array([e['encoding'] for e in accepted], dtype=np.float32)
+        matches = gallery.match(matrix, duplicate_distance) if len(gallery) else [(None, None, None)] * len(accepted)
+        sq = np.einsum('ij,ij->i', matrix, matrix)
+        within = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2 * matrix @ matrix.T, 0))
+        for i, (entry, (sid, sname, dist)) in enumerate(zip(accepted, matches)):
+            if entry['roll'] in enrolled_rolls:
+                entry['status'], entry['reason'] = 'duplicate', "roll number already enrolled or repeated"
+            elif sid is not None:
+                entry['status'], entry['reason'] = 'duplicate', "face matches an enrolled student"
+                entry['match_id'], entry['match_name'], entry['distance'] = sid, sname, round(float(dist), 4)
+            else:
+                j = int(np.argmin(within[i, :i])) if i else None
+                if j is not None and within[i, j] <= duplicate_distance:
+                    entry['status'], entry['reason'] = 'duplicate', f"face matches row {accepted[j]['row']}"
+                    entry['match_name'], entry['distance'] = accepted[j]['name'], round(float(within[i, j]), 4)
+            enrolled_rolls.add(entry['roll'])
+            if entry['status'] is None or allow_duplicates:
+                entry['status'] = entry['status'] or ('ok' if dry_run else 'enrolled')
+                entry['insert'] = True
+
+    to_insert = [e for e in accepted if e.pop('insert', False)]
+    if not dry_run and to_insert:
+        ids = add_students_bulk((e['name'], e['roll'], e['room'], e['encoding'], source.read(e['photo']),
+                                 e['thumbnail']) for e in to_insert)
+        for entry, sid in zip(to_insert, ids):
+            entry['student_id'] = sid
+            if entry['status'] == 'duplicate':
+                entry['reason'] += " (enrolled anyway)"
+    for entry in accepted:
+        entry.pop('encoding', None)
+        entry.pop('thumbnail', None)
+    return report
+
+
+def write_report(report, fileobj):
+    writer = csv.DictWriter(fileobj, REPORT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enroll many students from a CSV manifest and a folder or zip of photos.")
+    parser.add_argument("manifest", help="CSV with name, roll, room and optionally photo columns")
+    parser.add_argument("photos", help="directory or .zip of photos (matched by the photo column or by roll)")
+    parser.add_argument("--workers", type=int, default=None, help="encoding processes (default: CPU count - 1)")
+    parser.add_argument("--duplicate-distance", type=float, default=DUPLICATE_DISTANCE)
+    parser.add_argument("--allow-duplicates", action="store_true", help="enroll rows flagged as likely duplicates")
+    parser.add_argument("--dry-run", action="store_true", help="encode and check, but don't write to the database")
+    parser.add_argument("--report", default="enrollment_report.csv")
+    args = parser.parse_args()
+    init_db()
+    with open(args.manifest, "rb") as f:
+        rows = read_manifest(f)
+    started = time.monotonic()
+
+    def progress(done, total):
+        print(f"\rEncoded {done}/{total} photos", end="", flush=True)
+
+    report = enroll(rows, PhotoSource(args.photos), args.workers, args.duplicate_distance, args.allow_duplicates,
+                    args.dry_run, progress)
+    print()
+    with open(args.report, "w", newline="") as f:
+        write_report(report, f)
+    counts = {}
+    for entry in report:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    print(f"{len(report)} rows in {time.monotonic() - started:.1f}s: {summary}. Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import csv
+import io
+import shlex
+import argparse
+import datetime
+from database import init_db, iter_logs, LOG_COLUMNS
+
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+# The Logs page hands its download to Streamlit, which holds it in memory;
+# larger exports are left to this CLI.
+UI_MAX_ROWS = 100000
+# Data rows per XLSX sheet: Excel's 1,048,576-row limit less the header.
+XLSX_SHEET_ROWS = 1048575
+
+
+def export_logs(fmt, fileobj, chunk_size=5000, include_archive=False, limit=None, **filters):
+    # Streams matching logs into a binary file object chunk by chunk, so
+    # memory stays flat however many rows are exported. Returns the row count.
+    if include_archive:
+        from archive import iter_all_logs
+        chunks = iter_all_logs(chunk_size, **filters)
+    else:
+        chunks = iter_logs(chunk_size, **filters)
+    if limit is not None:
+        chunks = _limit_chunks(chunks, limit)
+    if fmt == "csv":
+        return _export_csv(fileobj, chunks)
+    if fmt == "parquet":
+        return _export_parquet(fileobj, chunks)
+    if fmt == "xlsx":
+        return _export_xlsx(fileobj, chunks)
+    raise ValueError(f"unknown export format {fmt!r}")
+
+
+def _limit_chunks(chunks, limit):
+    for rows in chunks:
+        if limit <= 0:
+            return
+        yield rows[:limit]
+        limit -= len(rows)
+
+
+def export_command(fmt, include_archive=False, **filters):
+    # The CLI call equivalent to an export from the Logs page.
+    args = ["python", "export.py", "--format", fmt]
+    for name in ("start", "end", "student", "room", "action"):
+        if filters.get(name) is not None:
+            args += [f"--{name}", str(filters[name])]
+    if include_archive:
+        args.append("--include-archive")
+    return " ".join(shlex.quote(a) for a in args)
+
+
+def _export_csv(fileobj, chunks):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(LOG_COLUMNS)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    text.detach()
+    return count
+
+
+def _export_parquet(fileobj, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ("ID", pa.int64()), ("Student ID", pa.int64()), ("Name", pa.string()), ("Room", pa.string()),
+        ("Action", pa.string()), ("Timestamp", pa.string()), ("Camera", pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table([pa.array(col, type=f.type) for col, f in zip(columns, schema)],
+                                        schema=schema))
+            count += len(rows)
+    return count
+
+
+def _export_xlsx(fileobj, chunks, sheet_rows=XLSX_SHEET_ROWS):
+    from openpyxl import Workbook
+    # write_only workbooks stream rows to disk instead of building cells in memory
+    wb = Workbook(write_only=True)
+    ws = None
+    count = 0
+    for rows in chunks:
+        for row in rows:
+            # Excel opens at most 1,048,576 rows per sheet: roll over to
+            # Logs (2), Logs (3), ... each with its own header.
+            if count % sheet_rows == 0:
+                ws = wb.create_sheet("Logs" if count == 0 else f"Logs ({count // sheet_rows + 1})")
+                ws.append(LOG_COLUMNS)
+            ws.append(row)
+            count += 1
+    if ws is None:
+        wb.create_sheet("Logs").append(LOG_COLUMNS)
+    wb.save(fileobj)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export entry/exit logs.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--out", help="output file (default hostel_logs_<date><ext>)")
+    parser.add_argument("--start", type=datetime.date.fromisoformat)
+    parser.add_argument("--end", type=datetime.date.fromisoformat)
+    parser.add_argument("--student", help="part of the student's name")
+    parser.add_argument("--room")
+    parser.add_argument("--action", choices=["entry", "exit"])
+    parser.add_argument("--include-archive", action="store_true", help="also export archived logs")
+    args = parser.parse_args()
+    init_db()
+    out = args.out or f"hostel_logs_{datetime.date.today():%Y%m%d}{FORMATS[args.format][1]}"
+    with open(out, "wb") as f:
+        count = export_logs(args.format, f, include_archive=args.include_archive,
+                            start=args.start, end=args.end, student=args.student, room=args.room,
+                            action=args.action)
+    print(f"Exported {count} rows -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import os
+import time
+import argparse
+import numpy as np
+
+INDEX_PATH = "gallery_index.npz"
+
+
+def _sq_dists(a, b, b_sq=None):
+    if b_sq is None:
+        b_sq = np.einsum('ij,ij->i', b, b)
+    d2 = np.einsum('ij,ij->i', a, a)[:, None] + b_sq[None, :] - 2.0 * (a @ b.T)
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+
+def _topk(d2, k):
+    # Indices of the k smallest values per row, sorted by distance.
+    k = min(k, d2.shape[1])
+    if k < d2.shape[1]:
+        part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(d2.shape[1]), d2.shape).copy()
+    order = np.take_along_axis(d2, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class BruteForceIndex:
+    # Exact linear scan. This is the reference every other index is measured
+    # against, and what FaceGallery does when no index is configured.
+    def build(self, matrix):
+        return (matrix, np.einsum('ij,ij->i', matrix, matrix))
+
+    def search(self, state, queries, k=1):
+        matrix, sq_norms = state
+        if len(matrix) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        d2 = _sq_dists(queries, matrix, sq_norms)
+        idx = _topk(d2, k)
+        return idx, np.sqrt(np.take_along_axis(d2, idx, axis=1))
+
+
+class IVFIndex:
+    # Inverted-file index: k-means buckets over the gallery, searched by
+    # probing the n_probe nearest buckets. Candidates are first scored in a
+    # low-dimensional PCA projection and only the best `rerank` of them get
+    # an exact 128-d distance. n_probe and rerank are the recall/latency
+    # knobs; larger means closer to brute force.
+    def __init__(self, n_lists=None, n_probe=8, rerank=32, pca_dim=32, train_iters=20, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank = rerank
+        self.pca_dim = pca_dim
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None
+        self.mean = None
+        self.components = None
+
+    def train(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(matrix))))
+        n_lists = min(n_lists, len(matrix))
+        rng = np.random.default_rng(self.seed)
+        centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assign = self._assign(matrix, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, matrix)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Re-seed empty buckets from random points so none stay dead.
+            if empty.any():
+                centroids[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+        self.centroids = centroids
+        self.mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.pca_dim].T, dtype=np.float32)
+        return self
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk=8192):
+        c_sq = np.einsum('ij,ij->i', centroids, centroids)
+        out = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            out[start:start + chunk] = _sq_dists(matrix[start:start + chunk], centroids, c_sq).argmin(axis=1)
+        return out
+
+    def build(self, matrix):
+        if len(matrix) == 0:
+            return None
+        if self.centroids is None:
+            self.train(matrix)
+        assign = self._assign(matrix, self.centroids)
+        order = np.argsort(assign, kind='stable')
+        offsets = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        projected = np.ascontiguousarray((matrix - self.mean) @ self.components)
+        return (matrix, order, offsets, projected, np.einsum('ij,ij->i', projected, projected))
+
+    def search(self, state, queries, k=1):
+        n_q = len(queries)
+        if state is None:
+            return np.empty((n_q, 0), dtype=np.int64), np.empty((n_q, 0), dtype=np.float32)
+        matrix, order, offsets, projected, p_sq = state
+        probe = _topk(_sq_dists(queries, self.centroids), self.n_probe)
+        q_proj = (queries - self.mean) @ self.components
+        k = min(k, len(matrix))
+        out_idx = np.full((n_q, k), -1, dtype=np.int64)
+        out_dist = np.full((n_q, k), np.inf, dtype=np.float32)
+        for i in range(n_q):
+            cand = np.concatenate([order[offsets[b]:offsets[b + 1]] for b in probe[i]])
+            if len(cand) == 0:
+                continue
+            if len(cand) > self.rerank:
+                approx = _sq_dists(q_proj[i:i + 1], projected[cand], p_sq[cand])
+                cand = cand[_topk(approx, self.rerank)[0]]
+            exact = _sq_dists(queries[i:i + 1], matrix[cand])
+            best = _topk(exact, k)[0]
+            out_idx[i, :len(best)] = cand[best]
+            out_dist[i, :len(best)] = np.sqrt(exact[0, best])
+        return out_idx, out_dist
+
+    def save(self, path=INDEX_PATH):
+        np.savez(path, centroids=self.centroids, mean=self.mean, components=self.components,
+                 params=np.array([self.n_probe, self.rerank, self.pca_dim]))
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        data = np.load(path)
+        n_probe, rerank, pca_dim = (int(v) for v in data['params'])
+        index = cls(n_lists=len(data['centroids']), n_probe=n_probe, rerank=rerank, pca_dim=pca_dim)
+        index.centroids = data['centroids']
+        index.mean = data['mean']
+        index.components = data['components']
+        return index
+
+
+def load_index(path=INDEX_PATH, n_probe=None, rerank=None):
+    # The trained index is optional: without the file the gallery falls back
+    # to the exact brute-force scan.
+    if not os.path.exists(path):
+        return None
+    index = IVFIndex.load(path)
+    if n_probe is not None:
+        index.n_probe = n_probe
+    if rerank is not None:
+        index.rerank = rerank
+    return index
+
+
+def measure_recall(index, matrix, queries, k=1):
+    # Queries are timed one at a time, the way a gate frame with one or two
+    # faces hits the matcher, rather than as one large BLAS batch.
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    exact = BruteForceIndex()
+    exact_state = exact.build(matrix)
+    t0 = time.perf_counter()
+    state = index.build(matrix)
+    build_s = time.perf_counter() - t0
+    hits = 0
+    exact_s = index_s = 0.0
+    for i in range(len(queries)):
+        q = queries[i:i + 1]
+        t0 = time.perf_counter()
+        ref, _ = exact.search(exact_state, q, k)
+        t1 = time.perf_counter()
+        got, _ = index.search(state, q, k)
+        t2 = time.perf_counter()
+        exact_s += t1 - t0
+        index_s += t2 - t1
+        hits += len(set(ref[0]) & set(got[0]))
+    return {
+        'recall': hits / float(len(queries) * min(k, len(matrix))),
+        'exact_ms_per_query': exact_s * 1000 / len(queries),
+        'index_ms_per_query': index_s * 1000 / len(queries),
+        'build_s': build_s,
+    }
+
+
+def _gallery_matrix():
+    from database import init_db, get_gallery_delta
+    init_db()
+    _, students, _ = get_gallery_delta(0)
+    return np.array([s['encoding'] for s in students], dtype=np.float32).reshape(-1, 128)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate the approximate gallery index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="train the IVF index on the current gallery and save it")
+    build.add_argument("--lists", type=int, default=None, help="number of k-means buckets (default sqrt(N))")
+    build.add_argument("--probe", type=int, default=8)
+    build.add_argument("--rerank", type=int, default=32)
+    build.add_argument("--out", default=INDEX_PATH)
+    recall = sub.add_parser("recall", help="compare the saved index against brute force")
+    recall.add_argument("--index", default=INDEX_PATH)
+    recall.add_argument("--probe", type=int, default=None)
+    recall.add_argument("--rerank", type=int, default=None)
+    recall.add_argument("--queries", type=int, default=500)
+    recall.add_argument("--noise", type=float, default=0.03)
+    args = parser.parse_args()
+
+    matrix = _gallery_matrix()
+    if len(matrix) == 0:
+        parser.error("the gallery is empty")
+    if args.command == "build":
+        index = IVFIndex(n_lists=args.lists, n_probe=args.probe, rerank=args.rerank).train(matrix)
+        index.save(args.out)
+        print(f"Trained {len(index.centroids)} lists on {len(matrix)} encodings -> {args.out}")
+    else:
+        index = load_index(args.index, args.probe, args.rerank)
+        if index is None:
+            parser.error(f"{args.index} not found; run the build command first")
+        rng = np.random.default_rng(0)
+        picks = rng.integers(0, len(matrix), args.queries)
+        queries = matrix[picks] + rng.normal(0, args.noise, (args.queries, matrix.shape[1])).astype(np.float32)
+        print(measure_recall(index, matrix, queries))
+
+
+if __name__ == "__main__":
+    main()
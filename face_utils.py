@@ -1,14 +1,48 @@
+import threading
 import face_recognition
 import mediapipe as mp
 import cv2
 import numpy as np
+from gallery import FaceGallery
 
 mp_face_detection = mp.solutions.face_detection
-face_detection = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.7)
 
-def detect_faces_mediapipe(frame):
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = face_detection.process(rgb)
+def make_face_detector():
+    # MediaPipe graphs are not safe to share between threads; each capture
+    # pipeline builds its own detector.
+    return mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.7)
+
+# The shared detector for callers that don't bring their own; built on first
+# use rather than at import, so importing this module stays cheap.
+_face_detection = None
+_face_detection_lock = threading.Lock()
+
+def get_face_detector():
+    global _face_detection
+    if _face_detection is None:
+        with _face_detection_lock:
+            if _face_detection is None:
+                _face_detection = make_face_detector()
+    return _face_detection
+
+def warm_up():
+    # Builds the MediaPipe graph and runs dlib once on a blank image, so the
+    # first real frame or registration doesn't pay for model loading.
+    blank = np.zeros((160, 160, 3), dtype=np.uint8)
+    get_face_detector().process(blank)
+    face_recognition.face_encodings(blank, known_face_locations=[(20, 140, 140, 20)])
+    return True
+
+# Fraction of the box size added on each side before dlib computes landmarks.
+ENCODE_MARGIN = 0.1
+# Faces whose box is smaller than this many pixels are upscaled to it before
+# encoding; 0 encodes every face at native resolution.
+UPSAMPLE_MIN_FACE = 0
+
+def detect_faces_mediapipe(frame, rgb=None, detector=None):
+    if rgb is None:
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    results = (detector or get_face_detector()).process(rgb)
     boxes = []
     if results.detections:
         h, w, _ = frame.shape
@@ -23,14 +57,50 @@ def detect_faces_mediapipe(frame):
             boxes.append((x1, y1, x2, y2))
     return boxes
 
+def boxes_to_locations(boxes, frame_shape, margin=ENCODE_MARGIN):
+    # MediaPipe (x1, y1, x2, y2) -> dlib/face_recognition (top, right, bottom, left)
+    h, w = frame_shape[:2]
+    locations = []
+    for x1, y1, x2, y2 in boxes:
+        mx = int((x2 - x1) * margin)
+        my = int((y2 - y1) * margin)
+        locations.append((max(0, y1 - my), min(w, x2 + mx), min(h, y2 + my), max(0, x1 - mx)))
+    return locations
+
+def encode_faces(frame, boxes, rgb=None, margin=ENCODE_MARGIN, upsample_min_face=UPSAMPLE_MIN_FACE, num_jitters=1):
+    # Encodes every box in one face_encodings call on a single RGB frame.
+    # Passing the MediaPipe boxes as known locations skips dlib's own HOG
+    # detector, so faces MediaPipe found are never dropped by a second pass.
+    # Returns one encoding (or None for a degenerate box) per input box.
+    if not boxes:
+        return []
+    if rgb is None:
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    locations = boxes_to_locations(boxes, rgb.shape, margin)
+    results = [None] * len(boxes)
+    batch, small = [], []
+    for i, (top, right, bottom, left) in enumerate(locations):
+        size = min(bottom - top, right - left)
+        if size <= 0:
+            continue
+        (small if size < upsample_min_face else batch).append(i)
+    if batch:
+        encodings = face_recognition.face_encodings(rgb, known_face_locations=[locations[i] for i in batch],
+                                                    num_jitters=num_jitters)
+        for i, encoding in zip(batch, encodings):
+            results[i] = encoding
+    for i in small:
+        top, right, bottom, left = locations[i]
+        scale = upsample_min_face / float(min(bottom - top, right - left))
+        crop = cv2.resize(rgb[top:bottom, left:right], None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        ch, cw = crop.shape[:2]
+        encodings = face_recognition.face_encodings(crop, known_face_locations=[(0, cw, ch, 0)],
+                                                    num_jitters=num_jitters)
+        results[i] = encodings[0] if encodings else None
+    return results
+
 def encode_face(frame, box):
-    x1, y1, x2, y2 = box
-    face_img = frame[y1:y2, x1:x2]
-    rgb_face = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-    encodings = face_recognition.face_encodings(rgb_face)
-    if encodings:
-        return encodings[0]
-    return None
+    return encode_faces(frame, [box])[0]
 
 def encode_face_pil(img_np):
     encodings = face_recognition.face_encodings(img_np)
@@ -39,12 +109,6 @@ def encode_face_pil(img_np):
     return None
 
 def recognize_face(face_encoding, known_students, tolerance=0.5):
-    filtered_students = [s for s in known_students if 'encoding' in s]
-    encodings = [s['encoding'] for s in filtered_students]
-    if not encodings:
-        return None, None
-    matches = face_recognition.compare_faces(encodings, face_encoding, tolerance)
-    if True in matches:
-        idx = matches.index(True)
-        return filtered_students[idx]['id'], filtered_students[idx]['name']
-    return None, None
+    gallery = known_students if isinstance(known_students, FaceGallery) else FaceGallery(known_students)
+    sid, sname, _ = gallery.match([face_encoding], tolerance)[0]
+    return sid, sname
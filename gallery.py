@@ -0,0 +1,225 @@
+import os
+import glob
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from database import init_db, get_gallery_version, get_gallery_delta
+
+ENCODING_DIM = 128
+SNAPSHOT_PATH = "gallery_snapshot"
+
+
+class FaceGallery:
+    # Resident copy of all known encodings: one contiguous float32 (N, 128)
+    # matrix with parallel id/name arrays, so matching a frame is one
+    # vectorized distance computation instead of a DB read per frame.
+    def __init__(self, students=None, index=None):
+        # index is an optional face_index searcher (e.g. IVFIndex); without
+        # one every match is an exact scan over the whole matrix.
+        self.index = index
+        self.load(students or [])
+
+    def load(self, students):
+        self._set(*self._arrays(students))
+
+    @classmethod
+    def from_snapshot(cls, path=SNAPSHOT_PATH, index=None):
+        gallery = FaceGallery(index=index)
+        gallery.version = gallery.load_snapshot(path)
+        return gallery
+
+    def load_snapshot(self, path=SNAPSHOT_PATH):
+        # The matrix is memory-mapped read-only, so every camera process
+        # loading the same snapshot shares one page-cached copy. The .json
+        # names the matrix file it was written with, so ids and rows always
+        # come from the same export.
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        # Snapshots from before versioned matrix files point at <path>.npy.
+        name = meta.get('matrix', os.path.basename(path) + ".npy")
+        if 'matrix' in meta and name != f"{os.path.basename(path)}.v{meta['version']}.npy":
+            raise ValueError(f"gallery snapshot {path} names {name} for version {meta['version']}")
+        matrix = np.load(os.path.join(os.path.dirname(path), name), mmap_mode='r')
+        if matrix.shape != (len(meta['ids']), ENCODING_DIM):
+            raise ValueError(f"gallery snapshot {path} has {matrix.shape[0]} rows "
+                             f"for {len(meta['ids'])} ids at version {meta['version']}")
+        self._set(np.array(meta['ids'], dtype=np.int64), np.array(meta['names'], dtype=object),
+                  np.array(meta['rooms'], dtype=object), matrix)
+        return meta['version']
+
+    @staticmethod
+    def _arrays(students):
+        students = [s for s in students if s.get('encoding') is not None]
+        ids = np.array([s['id'] for s in students], dtype=np.int64)
+        names = np.array([s['name'] for s in students], dtype=object)
+        rooms = np.array([s.get('room') for s in students], dtype=object)
+        matrix = np.array([s['encoding'] for s in students], dtype=np.float32).reshape(-1, ENCODING_DIM)
+        return ids, names, rooms, matrix
+
+    def _set(self, ids, names, rooms, matrix):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+        index_state = self.index.build(matrix) if self.index is not None else None
+        # Swap everything in one assignment so concurrent readers never see
+        # a matrix that doesn't line up with its ids.
+        self._data = (ids, names, rooms, matrix, sq_norms, index_state)
+
+    def apply_delta(self, changed, removed_ids=()):
+        # Updated students are dropped and re-appended, so one pass handles
+        # additions, updates and removals alike.
+        ids, names, rooms, matrix = self._data[:4]
+        new_ids, new_names, new_rooms, new_matrix = self._arrays(changed)
+        drop = np.concatenate([np.array([s['id'] for s in changed], dtype=np.int64),
+                               np.asarray(list(removed_ids), dtype=np.int64)])
+        keep = ~np.isin(ids, drop)
+        self._set(np.concatenate([ids[keep], new_ids]),
+                  np.concatenate([names[keep], new_names]),
+                  np.concatenate([rooms[keep], new_rooms]),
+                  np.concatenate([matrix[keep], new_matrix]))
+
+    @property
+    def ids(self):
+        return self._data[0]
+
+    @property
+    def names(self):
+        return self._data[1]
+
+    @property
+    def rooms(self):
+        return self._data[2]
+
+    @property
+    def matrix(self):
+        return self._data[3]
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def distances(self, encodings):
+        return self._distances(self._data, encodings)
+
+    @staticmethod
+    def _distances(data, encodings):
+        matrix, sq_norms = data[3], data[4]
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        d2 = np.einsum('ij,ij->i', queries, queries)[:, None] + sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2)
+
+    def match(self, encodings, tolerance=0.5):
+        # Returns one (student_id, name, distance) per query encoding, with the
+        # nearest student rather than the first one under tolerance.
+        # Unmatched faces get (None, None, distance-to-nearest).
+        data = self._data
+        ids, names = data[0], data[1]
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(queries) == 0:
+            return []
+        if len(ids) == 0:
+            return [(None, None, None)] * len(queries)
+        if self.index is not None:
+            best, best_dist = self.index.search(data[5], queries, 1)
+            best, best_dist = best[:, 0], best_dist[:, 0]
+        else:
+            dist = self._distances(data, queries)
+            best = np.argmin(dist, axis=1)
+            best_dist = dist[np.arange(len(queries)), best]
+        results = []
+        for idx, d in zip(best, best_dist):
+            if idx >= 0 and d <= tolerance:
+                results.append((int(ids[idx]), names[idx], float(d)))
+            else:
+                results.append((None, None, float(d)))
+        return results
+
+
+class LiveGallery(FaceGallery):
+    # A FaceGallery kept in sync with the students table. refresh() is cheap
+    # enough to call every frame: it polls the gallery version at most once
+    # per refresh_interval and only pulls the rows that changed.
+    def __init__(self, refresh_interval=0.5, index=None, snapshot=None):
+        super().__init__(index=index)
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._checked_at = 0.0
+        # Several camera pipelines may share one gallery and refresh it from
+        # their own threads.
+        self._refresh_lock = threading.Lock()
+        if snapshot and os.path.exists(snapshot + ".json"):
+            # Start from the shared snapshot; refresh() then pulls only the
+            # rows written since it was exported.
+            self.version = self.load_snapshot(snapshot)
+        else:
+            self.reload()
+
+    def reload(self):
+        version, students, _ = get_gallery_delta(0)
+        self.load(students)
+        self.version = version
+        self._checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return False
+        with self._refresh_lock:
+            if not force and now - self._checked_at < self.refresh_interval:
+                return False
+            self._checked_at = now
+            if get_gallery_version() == self.version:
+                return False
+            if self.version == 0:
+                # A delta since version 0 is every student with no tombstones,
+                # so it cannot remove anyone: replace the gallery instead.
+                self.reload()
+                return True
+            version, changed, removed = get_gallery_delta(self.version)
+            self.apply_delta(changed, removed)
+            self.version = version
+            return True
+
+def export_snapshot(path=SNAPSHOT_PATH):
+    # The matrix goes to a file named for its version; renaming the .json
+    # that points at it is the single step that publishes the snapshot.
+    # Processes that already mapped an older matrix keep reading it, and the
+    # one before the new snapshot is kept for readers midway through a load.
+    version, students, _ = get_gallery_delta(0)
+    gallery = FaceGallery(students)
+    matrix_path = f"{path}.v{version}.npy"
+    if not os.path.exists(matrix_path):
+        # One version is one set of rows, so an existing file (possibly
+        # mapped by a reader right now) is already correct.
+        np.save(matrix_path + ".tmp.npy", np.asarray(gallery.matrix, dtype='<f4'))
+        os.replace(matrix_path + ".tmp.npy", matrix_path)
+    previous = None
+    if os.path.exists(path + ".json"):
+        with open(path + ".json") as f:
+            previous = json.load(f).get('matrix')
+    with open(path + ".tmp.json", "w") as f:
+        json.dump({'version': version, 'matrix': os.path.basename(matrix_path), 'ids': gallery.ids.tolist(),
+                   'names': gallery.names.tolist(), 'rooms': gallery.rooms.tolist()}, f)
+    os.replace(path + ".tmp.json", path + ".json")
+    keep = {os.path.basename(matrix_path), previous}
+    for old in glob.glob(glob.escape(path) + ".v*.npy"):
+        if os.path.basename(old) not in keep:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return version, len(gallery)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the face gallery as a memory-mappable snapshot.")
+    parser.add_argument("--out", default=SNAPSHOT_PATH, help="path prefix for the .json and .v<version>.npy files")
+    args = parser.parse_args()
+    init_db()
+    version, count = export_snapshot(args.out)
+    print(f"Exported {count} encodings at gallery version {version} -> {args.out}.json")
+
+
+if __name__ == "__main__":
+    main()
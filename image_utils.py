@@ -0,0 +1,13 @@
+import io
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZE = 160
+
+
+def make_thumbnail(image_bytes, size=THUMBNAIL_SIZE, quality=80):
+    # Small JPEG used by student listings, so pages never load originals.
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGB")
+    img.thumbnail((size, size))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
@@ -0,0 +1,304 @@
+import os
+import re
+import json
+import hmac
+import time
+import struct
+import signal
+import logging
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import metrics
+from database import init_db, get_connection, add_log, flush_logs, pending_logs
+from gallery import LiveGallery, ENCODING_DIM
+from face_index import load_index
+
+log = logging.getLogger("hostelfacelog.ingest")
+
+# Edge cameras run detection and encoding themselves and POST batches of
+# embeddings to /v1/embeddings as application/octet-stream:
+#
+#   header   <4sBBBH  magic b"HFL1", dtype (0 float32, 1 float16),
+#                     role (0 entry, 1 exit), camera name length, count
+#   camera   utf-8 bytes, matching CAMERA_NAME
+#   times    count x <f8   capture time, unix seconds
+#   vectors  count x 128 little-endian float32 or float16
+#
+# The reply is JSON: one {student_id, name, distance, logged} per embedding,
+# in order. float16 halves the payload and moves distances by ~1e-4.
+MAGIC = b"HFL1"
+HEADER = struct.Struct("<4sBBBH")
+DTYPES = (np.dtype("<f4"), np.dtype("<f2"))
+ROLES = ("entry", "exit")
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+PORT = 8765
+MAX_BODY = 4 * 1024 * 1024
+# Capture times further ahead of this machine's clock are rejected.
+MAX_CLOCK_SKEW = 300.0
+TOKEN_HEADER = "X-Ingest-Token"
+# Camera names end up in the logs table, so they are held to plain names.
+CAMERA_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.:-]{0,63}")
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def encode_batch(camera, action, times, embeddings, dtype=np.float16):
+    # The edge side of the wire format above.
+    name = camera.encode()
+    dtype = np.dtype(dtype).newbyteorder("<")
+    vectors = np.asarray(embeddings, dtype=dtype).reshape(-1, ENCODING_DIM)
+    return b"".join((HEADER.pack(MAGIC, DTYPES.index(dtype), ROLES.index(action), len(name), len(vectors)),
+                     name, np.asarray(times, dtype="<f8").tobytes(), vectors.tobytes()))
+
+
+def decode_batch(body, max_batch=256):
+    # Returns (camera, action, times, embeddings) without copying the vectors.
+    if len(body) < HEADER.size:
+        raise PayloadError("truncated header")
+    magic, dtype, role, name_len, count = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise PayloadError("bad magic")
+    if dtype >= len(DTYPES) or role >= len(ROLES):
+        raise PayloadError("unknown dtype or role")
+    if not 0 < count <= max_batch:
+        raise PayloadError(f"batch size must be 1..{max_batch}")
+    dtype = DTYPES[dtype]
+    offset = HEADER.size + name_len
+    expected = offset + count * 8 + count * ENCODING_DIM * dtype.itemsize
+    if len(body) != expected:
+        raise PayloadError(f"expected {expected} bytes, got {len(body)}")
+    try:
+        camera = body[HEADER.size:offset].decode()
+    except UnicodeDecodeError:
+        raise PayloadError("camera name is not utf-8")
+    if not CAMERA_NAME.fullmatch(camera):
+        raise PayloadError("camera name must be 1-64 letters, digits, '_', '.', ':' or '-'")
+    times = np.frombuffer(body, dtype="<f8", count=count, offset=offset)
+    embeddings = np.frombuffer(body, dtype=dtype, offset=offset + count * 8).reshape(count, ENCODING_DIM)
+    return camera, ROLES[role], times, embeddings
+
+
+class LogDeduper:
+    # The ingest counterpart of FaceTracker.relog_after: a student seen again
+    # at the same kind of gate within `window` seconds of capture time is the
+    # same pass, whichever edge box saw it and however the batches interleave.
+    # Edges retrying a request after a timeout are absorbed the same way.
+    def __init__(self, window=60.0):
+        self.window = window
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def seed(self):
+        # Recent log rows, so a restarted server does not log the same passes again.
+        since = (datetime.datetime.now() - datetime.timedelta(seconds=self.window)).strftime(TIMESTAMP_FORMAT)
+        rows = get_connection().execute("SELECT student_id, action, timestamp FROM logs "
+                                        "WHERE student_id IS NOT NULL AND timestamp >= ?", (since,))
+        with self._lock:
+            for student_id, action, timestamp in rows:
+                ts = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+                self._last[(student_id, action)] = max(ts, self._last.get((student_id, action), ts))
+
+    def claim(self, student_id, action, ts):
+        key = (student_id, action)
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and abs(ts - last) < self.window:
+                return False
+            self._last[key] = ts if last is None else max(ts, last)
+            if len(self._last) > 100000:
+                cutoff = ts - self.window
+                self._last = {k: v for k, v in self._last.items() if v >= cutoff}
+            return True
+
+
+class IngestServer(ThreadingHTTPServer):
+    # One thread per connection; edges keep their connection open. At most
+    # max_inflight batches are matched at once, and requests beyond that, or
+    # while the log writer is backed up, get 503 with Retry-After instead of
+    # queueing without bound.
+    daemon_threads = True
+    # Listen backlog; the default of 5 drops connects when many edges start at once.
+    request_queue_size = 128
+
+    def __init__(self, address, gallery, tolerance=0.5, token=None, max_inflight=8, max_batch=256,
+                 relog_after=60.0, max_log_backlog=5000):
+        super().__init__(address, _Handler)
+        self.gallery = gallery
+        self.tolerance = tolerance
+        self.token = token
+        self.max_batch = max_batch
+        self.max_log_backlog = max_log_backlog
+        self.deduper = LogDeduper(relog_after)
+        self.deduper.seed()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._inflight_lock = threading.Lock()
+        self.inflight = 0
+        self._requests = metrics.rate("ingest_requests")
+        self._rejected = metrics.rate("ingest_rejected")
+        metrics.gauge("ingest_inflight", lambda: self.inflight)
+
+    def try_acquire(self):
+        if pending_logs() > self.max_log_backlog or not self._slots.acquire(blocking=False):
+            self._rejected.mark()
+            return False
+        with self._inflight_lock:
+            self.inflight += 1
+        return True
+
+    def release(self):
+        with self._inflight_lock:
+            self.inflight -= 1
+        self._slots.release()
+
+    def ingest(self, camera, action, times, embeddings):
+        if not np.isfinite(times).all() or times.max() > time.time() + MAX_CLOCK_SKEW or times.min() <= 0:
+            raise PayloadError("capture times must be unix seconds, not in the future")
+        if not np.isfinite(embeddings).all():
+            raise PayloadError("embeddings must be finite")
+        self._requests.mark()
+        # No camera label: names come from the client, and every new one
+        # would add a series.
+        metrics.observe("ingest_batch_size", len(times))
+        self.gallery.refresh()
+        with metrics.timer("ingest_match_seconds"):
+            matches = self.gallery.match(embeddings, self.tolerance)
+        results = []
+        for ts, (sid, name, dist) in zip(times.tolist(), matches):
+            logged = sid is not None and self.deduper.claim(sid, action, ts)
+            if logged:
+                timestamp = datetime.datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+                add_log(sid, name, action, timestamp=timestamp, camera=camera)
+            results.append({'student_id': sid, 'name': name,
+                            'distance': None if dist is None else round(dist, 4), 'logged': logged})
+        return results
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY each
+    # keep-alive request stalls ~40 ms on the peer's delayed ACK.
+    disable_nagle_algorithm = True
+    # Idle keep-alive connections are closed after this many seconds.
+    timeout = 60
+
+    def _reply(self, status, payload, content_type="application/json", headers=()):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        return not token or hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/health":
+            gallery = self.server.gallery
+            self._reply(200, {'status': 'ok', 'students': len(gallery), 'gallery_version': gallery.version,
+                              'inflight': self.server.inflight, 'pending_logs': pending_logs()})
+        elif path == "/metrics":
+            self._reply(200, metrics.registry.render().encode(), "text/plain; version=0.0.4")
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        # The body is always read in full, so the connection stays usable
+        # for the next request whatever the outcome.
+        # Without a valid length the body cannot be framed, so the connection
+        # is closed after the error reply.
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            self._reply(411, {'error': 'Content-Length required'})
+            return
+        if not header.strip().isdigit():
+            self.close_connection = True
+            self._reply(400, {'error': 'bad Content-Length'})
+            return
+        length = int(header)
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._reply(413, {'error': f'body larger than {MAX_BODY} bytes'})
+            return
+        body = self.rfile.read(length)
+        if self.path.split("?")[0] != "/v1/embeddings":
+            self._reply(404, {'error': 'not found'})
+            return
+        if not self._authorized():
+            self._reply(401, {'error': 'bad or missing ' + TOKEN_HEADER})
+            return
+        if not self.server.try_acquire():
+            self._reply(503, {'error': 'busy'}, headers=[("Retry-After", "1")])
+            return
+        try:
+            with metrics.timer("ingest_request_seconds"):
+                camera, action, times, embeddings = decode_batch(body, self.server.max_batch)
+                results = self.server.ingest(camera, action, times, embeddings)
+        except PayloadError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        except Exception:
+            # e.g. sqlite errors from gallery.refresh(); edges still get an answer.
+            log.exception("ingest failed")
+            self._reply(500, {'error': 'internal error'})
+            return
+        finally:
+            self.server.release()
+        self._reply(200, {'camera': camera, 'action': action, 'results': results})
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP ingest service for edge cameras that send face embeddings.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (0.0.0.0 to accept edges on the LAN)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--token", default=os.environ.get("HOSTELFACELOG_INGEST_TOKEN"),
+                        help=f"shared secret edges send in {TOKEN_HEADER} (default: $HOSTELFACELOG_INGEST_TOKEN)")
+    parser.add_argument("--max-inflight", type=int, default=max(2, os.cpu_count() or 2),
+                        help="batches matched concurrently before answering 503")
+    parser.add_argument("--max-batch", type=int, default=256, help="embeddings per request")
+    parser.add_argument("--relog-seconds", type=float, default=60.0,
+                        help="a student seen again within this many seconds is not logged twice")
+    parser.add_argument("--metrics-file", default="", help="Prometheus text file rewritten every few seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s: %(message)s")
+
+    init_db()
+    gallery = LiveGallery(index=load_index())
+    server = IngestServer((args.host, args.port), gallery, args.tolerance, args.token, args.max_inflight,
+                          args.max_batch, args.relog_seconds)
+    if args.host not in ("127.0.0.1", "localhost") and not args.token:
+        log.warning("accepting embeddings from the network without --token")
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+    threading.Thread(target=server.serve_forever, name="ingest-http", daemon=True).start()
+    log.info("ingesting on http://%s:%d/v1/embeddings, %d students in gallery", args.host, args.port, len(gallery))
+    last_metrics = 0.0
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(1.0)
+            if args.metrics_file and metrics.ENABLED and time.monotonic() - last_metrics >= 5.0:
+                metrics.write_textfile(args.metrics_file)
+                last_metrics = time.monotonic()
+    finally:
+        server.shutdown()
+        server.server_close()
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()
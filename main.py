@@ -3,17 +3,25 @@ from PIL import Image
 import streamlit as st
 import pandas as pd
 import io
-import cv2
 import numpy as np
 from PIL import Image
 import datetime
-import base64
-import matplotlib.pyplot as plt
+import tempfile
 import time
 import re
+import importlib
+import threading
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from database import *
-from face_utils import *
+from gallery import LiveGallery
+from face_index import load_index
+from visitors import get_snapshot_path, delete_visitor
+from export import export_logs, export_command, FORMATS as EXPORT_FORMATS, UI_MAX_ROWS as EXPORT_UI_MAX_ROWS
+from archive import query_logs_page
+import metrics
+from enroll import PhotoSource, read_manifest, enroll, write_report, REPORT_COLUMNS
 
 st.set_page_config(page_title="Hostel Face Recognition", layout="wide")
 
@@ -47,32 +55,98 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def img_bytes_to_base64(img_bytes):
-    return base64.b64encode(img_bytes).decode('utf-8')
-
 init_db()
 
+# OpenCV, MediaPipe and dlib are only needed by the camera and registration
+# pages. They are imported on first use (Python keeps the module, so the
+# models inside are process-wide singletons), and those pages start the
+# encoding pool and a background warm-up when they are first opened, so the
+# other pages never pay for them.
+def vision():
+    import face_utils
+    return face_utils
+
+@st.cache_resource
+def _start_encoder_pool():
+    # One pool of encoding processes shared by every camera page and session.
+    # Its workers are started here, on the script thread, and load the models
+    # in parallel with the app. They are spawned: Streamlit's own threads and
+    # any running camera engines would otherwise be forked mid-lock.
+    workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=importlib.import_module, initargs=("face_utils",),
+                               mp_context=multiprocessing.get_context("spawn"))
+    for _ in range(workers):
+        pool.submit(int)
+    return pool
+
+def load_encoder_pool():
+    # A pool whose worker process died stays broken; drop it from the cache
+    # so the next camera session gets a new one.
+    pool = _start_encoder_pool()
+    if getattr(pool, "_broken", False):
+        _start_encoder_pool.clear()
+        pool = _start_encoder_pool()
+    return pool
+
+@st.cache_resource
+def warm_up_vision():
+    # Once per process: loads the in-process models on a background thread.
+    threading.Thread(target=lambda: vision().warm_up(), name="model-warmup", daemon=True).start()
+
+@st.cache_resource
+def load_gallery():
+    # Shared by all sessions; refresh() keeps it in sync with the students table.
+    return LiveGallery(index=load_index())
+
 def room_sort_key(room):
     m = re.match(r"([A-Za-z]+)-(\d+)", room)
     if m:
         return (m.group(1), int(m.group(2)))
     return (room, 0)
 
+def run_camera_loop(action, state_key, message_placeholder, img_placeholder, box_color, message_color, message):
+    # Watches the shared engine for this camera: capture and recognition run
+    # once per process however many tabs are open, and this loop only shows
+    # the latest preview JPEG and the events since it joined.
+    from engine import get_engine
+    engine, last_event = get_engine(action, load_gallery(), executor=load_encoder_pool(), box_color=box_color)
+    last_seq = 0
+    try:
+        while st.session_state[state_key]:
+            status_msg = ""
+            for event in engine.events(last_event):
+                last_event = event['id']
+                if event['kind'] == 'logged':
+                    status_msg = message.format(name=event['name'], time=event['time'])
+                else:
+                    status_msg = "<span style='color:#eab308'>⚠️ Unknown person detected!</span>"
+            # --- Set the message above the live feed ---
+            if status_msg:
+                message_placeholder.markdown(f'<div style="font-size:1.5em; color:{message_color};">{status_msg}</div>', unsafe_allow_html=True)
+            latest = engine.frame(last_seq, timeout=1.0)
+            if latest is None:
+                if not engine.alive:
+                    break
+                continue
+            last_seq, jpeg = latest
+            img_placeholder.image(jpeg, caption="Live Camera Frame")
+    finally:
+        engine.unsubscribe()
+
 def count_unknown_visitors_today():
-    folder = "unknown_entries"
-    if not os.path.exists(folder):
-        return 0
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    return len([f for f in os.listdir(folder) if f.startswith(f"visitor.{today}") and f.endswith(".jpg")])
+    # Visitors first seen today, from the indexed visitors table.
+    return count_visitors(datetime.date.today())
 
 PAGE_DICT = {
     "Dashboard": "📊 Dashboard",
     "Entry Camera": "👤 Entry",
     "Exit Camera": "🚪 Exit",
     "Register Student": "📝 Register",
+    "Bulk Enrollment": "📦 Bulk Enroll",
     "Registered Students": "👨‍🎓 Students",
     "Logs": "🗂️ Logs",
-    "Unknown Entries": "🙎🏻 Visitors"
+    "Unknown Entries": "🙎🏻 Visitors",
+    "System Health": "🩺 Health"
 }
 PAGES = list(PAGE_DICT.keys())
 
@@ -85,31 +159,17 @@ page = st.sidebar.radio(
 
 # === DASHBOARD ===
 if page == "Dashboard":
+    import matplotlib.pyplot as plt
     st.markdown('<div class="big-title">Hostel Dashboard</div>', unsafe_allow_html=True)
-    logs = get_logs()
-    df = pd.DataFrame(logs, columns=["ID", "Student ID", "Name", "Action", "Timestamp"])
-
-    students = get_all_students()
-    inside = []
-    outside = []
-    for s in students:
-        last = get_last_action(s['id'])
-        if last == "entry":
-            inside.append(s['name'])
-        else:
-            outside.append(s['name'])
-
-    # Optional: Calculate today's entries/exits
-    today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['Timestamp']).dt.date
-        entries_today = df[(df['Action'] == 'entry') & (df['date'] == datetime.date.today())].shape[0]
-        exits_today = df[(df['Action'] == 'exit') & (df['date'] == datetime.date.today())].shape[0]
-        visitors_today = df[(df['Action'] == 'Visitors') & (df['date'] == datetime.date.today())].shape[0]
-    else:
-        entries_today = 0
-        exits_today = 0
-        visitors_today = 0
+    students = get_occupancy()
+    inside = [s['name'] for s in students if s['state'] == "entry"]
+    outside = [s['name'] for s in students if s['state'] != "entry"]
+
+    # Today's entries/exits, counted in SQL
+    today = datetime.date.today()
+    action_counts = get_action_counts(today)
+    entries_today = action_counts.get('entry', 0)
+    exits_today = action_counts.get('exit', 0)
 
     # Row of metrics with emojis and daily info
     col1, col2, col3 = st.columns(3)
@@ -136,11 +196,11 @@ if page == "Dashboard":
     st.markdown('<h2 style="margin-top:18px; margin-bottom:0.7em;"><span style="font-size:1.3em;">📊</span> <span style="color:#2563eb;">Current Status Distribution</span></h2>', unsafe_allow_html=True)
 
     # ----- PIE CHART FOR INDIDE HOSTEL AND STUDENTS INSIDE BY ROOM -----
-    inside_students = [s for s in get_all_students() if s['name'] in inside]
+    inside_students = [s for s in students if s['state'] == "entry"]
     room_dict = defaultdict(list)
     for student in inside_students:
         room_dict[student['room']].append(student['name'])
-    room_counts = {room: len(names) for room, names in room_dict.items()}
+    room_counts = get_room_inside_counts()
 
     col1, col2 = st.columns([1, 1])  # 1 for pie, 1.3 for bar
 
@@ -174,7 +234,7 @@ if page == "Dashboard":
             "id": [s['id'] for s in students],
             "Name": [s['name'] for s in students],
             "Room": [s['room'] for s in students],
-            "Status": [("Inside" if s['name'] in inside else "Outside") for s in students]
+            "Status": [("Inside" if s['state'] == "entry" else "Outside") for s in students]
         })
         def color_status(val):
             color = '#22c55e' if val == 'Inside' else '#ef4444'
@@ -196,7 +256,6 @@ if page == "Dashboard":
         if not inside_students:
             st.info("No students are currently inside any room.")
         else:
-            room_counts = {room: len(names) for room, names in room_dict.items()}
             labels = list(room_counts.keys())
             sizes = list(room_counts.values())
             colors = plt.cm.Paired(np.arange(len(labels)))
@@ -245,14 +304,24 @@ if page == "Dashboard":
             room_df = pd.DataFrame(list(room_counts.items()), columns=["Room", "Students Inside"])
             st.bar_chart(room_df.set_index("Room"))
 
+    st.subheader("Today's Gate Traffic by Hour")
+    hourly = get_hourly_counts(today)
+    if not hourly:
+        st.info("No gate events today.")
+    else:
+        hourly_df = pd.DataFrame(hourly, columns=["Hour", "Action", "Count"])
+        hourly_df["Hour"] = hourly_df["Hour"].str[11:13] + ":00"
+        st.bar_chart(hourly_df.pivot(index="Hour", columns="Action", values="Count").fillna(0))
+
 
 # === ENTRY CAMERA (Continuous) ===
 elif page == "Entry Camera":
     st.markdown('<div class="big-title">Entry Camera</div>', unsafe_allow_html=True)
+    st.caption("For unattended 24/7 gates, run `python worker.py --config cameras.yaml` instead of keeping this page open.")
     if 'entry_camera_on' not in st.session_state:
         st.session_state.entry_camera_on = False
-    if 'entry_logged_ids' not in st.session_state:
-        st.session_state.entry_logged_ids = set()
+    load_encoder_pool()
+    warm_up_vision()
 
     start = st.button("Start Entry Camera")
     stop = st.button("Stop Entry Camera")
@@ -263,57 +332,22 @@ elif page == "Entry Camera":
 
     if start:
         st.session_state.entry_camera_on = True
-        st.session_state.entry_logged_ids = set()
     if stop:
         st.session_state.entry_camera_on = False
 
     if st.session_state.entry_camera_on:
-        cap = cv2.VideoCapture(0)
-        while st.session_state.entry_camera_on:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_display = frame.copy()
-            boxes = detect_faces_mediapipe(frame)
-            known_students = get_all_students()
-            # -- Clear message before every frame --
-            status_msg = ""
-            for box in boxes:
-                x1, y1, x2, y2 = box
-                cv2.rectangle(frame_display, (x1, y1), (x2, y2), (0,200,83), 2)
-                encoding = encode_face(frame, box)
-                if encoding is not None:
-                    sid, sname = recognize_face(encoding, known_students)
-                    if sid and (sid not in st.session_state.entry_logged_ids):
-                        add_log(sid, sname, "entry")
-                        st.session_state.entry_logged_ids.add(sid)
-                        status_msg = f"✅ <b>{sname}</b> has ENTERED Hostel at {datetime.datetime.now().strftime('%H:%M:%S')}"
-                    elif sid is None:
-                        # Unknown face detected
-                        status_msg = "<span style='color:#eab308'>⚠️ Unknown person detected!</span>"
-                        # Optional: Save snapshot of unknown face (uncomment if you want this)
-                        face_img = frame[y1:y2, x1:x2]
-                        import os
-                        if not os.path.exists("unknown_entries"):
-                            os.makedirs("unknown_entries")
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                            cv2.imwrite(f"unknown_entries/visitor.{timestamp}.jpg", face_img)
-            # --- Set the message above the live feed ---
-            if status_msg:
-                message_placeholder.markdown(f'<div style="font-size:1.5em; color:#16a34a;">{status_msg}</div>', unsafe_allow_html=True)
-            img_placeholder.image(frame_display, channels='BGR', caption="Live Camera Frame")
-            time.sleep(0.1)
-            if not st.session_state.entry_camera_on:
-                break
-        cap.release()
+        run_camera_loop("entry", "entry_camera_on", message_placeholder, img_placeholder,
+                        box_color=(0,200,83), message_color="#16a34a",
+                        message="✅ <b>{name}</b> has ENTERED Hostel at {time}")
 
 # === EXIT CAMERA (Continuous) ===
 elif page == "Exit Camera":
     st.markdown('<div class="big-title">Exit Camera</div>', unsafe_allow_html=True)
+    st.caption("For unattended 24/7 gates, run `python worker.py --config cameras.yaml` instead of keeping this page open.")
     if 'exit_camera_on' not in st.session_state:
         st.session_state.exit_camera_on = False
-    if 'exit_logged_ids' not in st.session_state:
-        st.session_state.exit_logged_ids = set()
+    load_encoder_pool()
+    warm_up_vision()
 
     start = st.button("Start Exit Camera")
     stop = st.button("Stop Exit Camera")
@@ -324,54 +358,18 @@ elif page == "Exit Camera":
 
     if start:
         st.session_state.exit_camera_on = True
-        st.session_state.exit_logged_ids = set()
     if stop:
         st.session_state.exit_camera_on = False
 
     if st.session_state.exit_camera_on:
-        cap = cv2.VideoCapture(0)
-        while st.session_state.exit_camera_on:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_display = frame.copy()
-            boxes = detect_faces_mediapipe(frame)
-            known_students = get_all_students()
-            status_msg = ""
-            for box in boxes:
-                x1, y1, x2, y2 = box
-                cv2.rectangle(frame_display, (x1, y1), (x2, y2), (200, 0, 30), 2)  # red rectangle for EXIT
-                encoding = encode_face(frame, box)
-                if encoding is not None:
-                    sid, sname = recognize_face(encoding, known_students)
-                    if sid and (sid not in st.session_state.exit_logged_ids):
-                        add_log(sid, sname, "exit")
-                        st.session_state.exit_logged_ids.add(sid)
-                        status_msg = f"🚪 <b>{sname}</b> has EXITED Hostel at {datetime.datetime.now().strftime('%H:%M:%S')}"
-                    elif sid is None:
-                        # Unknown face detected
-                        status_msg = "<span style='color:#eab308'>⚠️ Unknown person detected!</span>"
-                        face_img = frame[y1:y2, x1:x2]
-                        import os
-                        if not os.path.exists("unknown_entries"):
-                            os.makedirs("unknown_entries")
-                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                        cv2.imwrite(f"unknown_entries/visitor_exit.{timestamp}.jpg", face_img)
-            # --- Set the message above the live feed ---
-            if status_msg:
-                message_placeholder.markdown(
-                    f'<div style="font-size:1.5em; color:#ef4444;">{status_msg}</div>',
-                    unsafe_allow_html=True
-                )
-            img_placeholder.image(frame_display, channels='BGR', caption="Live Camera Frame")
-            time.sleep(0.1)
-            if not st.session_state.exit_camera_on:
-                break
-        cap.release()
+        run_camera_loop("exit", "exit_camera_on", message_placeholder, img_placeholder,
+                        box_color=(200, 0, 30), message_color="#ef4444",  # red rectangle for EXIT
+                        message="🚪 <b>{name}</b> has EXITED Hostel at {time}")
 
 # === REGISTER STUDENT ===
 elif page == "Register Student":
     st.markdown('<div class="big-title">Register New Student </div>', unsafe_allow_html=True)
+    warm_up_vision()
     name = st.text_input("Student Name")
     roll = st.text_input("Roll Number")
     room = st.text_input("Room Number")
@@ -386,35 +384,76 @@ elif page == "Register Student":
             img_np = np.array(image)
             st.image(image, caption="Uploaded Photo", width=200)
 
-            encoding = encode_face_pil(img_np)
+            encoding = vision().encode_face_pil(img_np)
             if encoding is not None:
                 add_student(name, roll, room, encoding, img_bytes)
                 st.success("Student registered successfully! 🎉")
             else:
                 st.error("No recognizable face found in the image. Try another photo.")
 
+# === BULK ENROLLMENT ===
+elif page == "Bulk Enrollment":
+    st.markdown('<div class="big-title">Bulk Enrollment</div>', unsafe_allow_html=True)
+    st.write("Upload a CSV with name, roll and room columns (and optionally photo), plus a zip of photos. "
+             "Photos are matched by the photo column, or by roll number.")
+    manifest_file = st.file_uploader("Manifest (CSV)", type=["csv"])
+    photos_zip = st.file_uploader("Photos (zip)", type=["zip"])
+    allow_duplicates = st.checkbox("Enroll likely duplicates anyway")
+    dry_run = st.checkbox("Dry run (check only, don't enroll)")
+
+    if st.button("Start Enrollment"):
+        if not (manifest_file and photos_zip):
+            st.warning("Please upload both the manifest and the photos.")
+        else:
+            try:
+                rows = read_manifest(manifest_file)
+            except ValueError as e:
+                st.error(str(e))
+                rows = []
+            if rows:
+                # The zip is spooled to disk so photos are read one at a time.
+                with tempfile.TemporaryFile() as zip_file:
+                    zip_file.write(photos_zip.getbuffer())
+                    progress_bar = st.progress(0.0, text="Encoding photos...")
+                    report = enroll(rows, PhotoSource(zip_file), allow_duplicates=allow_duplicates, dry_run=dry_run,
+                                    progress=lambda done, total: progress_bar.progress(
+                                        done / total, text=f"Encoded {done}/{total} photos"))
+                counts = pd.Series([e['status'] for e in report]).value_counts()
+                st.success(", ".join(f"{n} {status}" for status, n in counts.items()))
+                report_df = pd.DataFrame(report, columns=REPORT_COLUMNS)
+                st.dataframe(report_df[report_df['status'].isin(['rejected', 'duplicate'])],
+                             use_container_width=True, hide_index=True)
+                report_csv = io.StringIO()
+                write_report(report, report_csv)
+                st.download_button("Download full report", report_csv.getvalue(), "enrollment_report.csv",
+                                   mime="text/csv")
+
 # === REGISTERED STUDENTS (EDITABLE) ===
 elif page == "Registered Students":
     st.markdown('<div class="big-title">Registered Students</div>', unsafe_allow_html=True)
-    students = get_all_students()
-    if not students:
+    ROOMS_PER_PAGE = 5
+    rooms = sorted(get_rooms(), key=room_sort_key)
+    if not rooms:
         st.info("No students registered yet.")
     else:
-        # Group students by room and sort
-        from collections import defaultdict
-        room_dict = defaultdict(list)
-        for s in students:
-            room_dict[s['room']].append(s)
+        # Rooms are paged; each room's students are loaded with thumbnails
+        # only, and the original photo is fetched on request.
+        page_count = (len(rooms) + ROOMS_PER_PAGE - 1) // ROOMS_PER_PAGE
+        room_page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+        page_rooms = rooms[(room_page - 1) * ROOMS_PER_PAGE:room_page * ROOMS_PER_PAGE]
         # Sort rooms as A-101, A-102, B-101, etc.
-        for i, (room, students_in_room) in enumerate(sorted(room_dict.items(), key=lambda x: room_sort_key(x[0]))):
+        for i, room in enumerate(page_rooms):
             if i > 0:
                 st.markdown("<hr style='margin: 10px 0;'>", unsafe_allow_html=True)
             st.markdown(f"<h4 style='color:#3b82f6;'>Room {room}</h4>", unsafe_allow_html=True)
-            # Sort students in room by name (optional)
-            for s in sorted(students_in_room, key=lambda x: x['id']):
+            for s in get_students_by_room(room):
                 with st.expander(f"{s['name']} (Roll {s['roll']})"):
-                    img_data = img_bytes_to_base64(s['image']) if s.get('image') else ''
-                    st.image(f"data:image/jpeg;base64,{img_data}", width=120)
+                    if s['thumbnail']:
+                        st.image(s['thumbnail'], width=120)
+                    if st.checkbox("Show full photo", key=f"full_{s['id']}"):
+                        full_image = get_student_image(s['id'])
+                        if full_image:
+                            st.image(full_image, width=360)
                     with st.form(f"edit_{s['id']}"):
                         name = st.text_input("Name", value=s['name'])
                         roll = st.text_input("Roll", value=s['roll'])
@@ -423,40 +462,177 @@ elif page == "Registered Students":
                         submit = st.form_submit_button("Save Changes")
                         if submit:
                             image_bytes = new_img.read() if new_img else None
-                            update_student(s['id'], name, roll, room_new, image_bytes)
-                            st.success("Profile updated! Refresh to see changes.")
+                            encoding = None
+                            if image_bytes is not None:
+                                img_np = np.array(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+                                encoding = vision().encode_face_pil(img_np)
+                            if image_bytes is not None and encoding is None:
+                                st.error("No recognizable face found in the new photo. Try another photo.")
+                            else:
+                                update_student(s['id'], name, roll, room_new, image_bytes, encoding)
+                                st.success("Profile updated! Refresh to see changes.")
 
 # === LOGS ===
 elif page == "Logs":
     st.markdown('<div class="big-title">All Logs</div>', unsafe_allow_html=True)
-    logs = get_logs()
-    df = pd.DataFrame(logs, columns=["ID", "Student ID", "Name", "Action", "Timestamp"])
-    st.dataframe(df, use_container_width=True)
-    st.write("Download all logs as Excel:")
-    excel_buffer = io.BytesIO()
-    df.to_excel(excel_buffer, index=False)
-    excel_buffer.seek(0)
-    st.download_button("Download Logs as Excel", excel_buffer, "hostel_logs.xlsx")
+    LOGS_PAGE_SIZE = 100
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        date_range = st.date_input("Date range", value=())
+    with col2:
+        student_filter = st.text_input("Student name")
+    with col3:
+        room_filter = st.selectbox("Room", [""] + sorted(get_rooms(), key=room_sort_key),
+                                   format_func=lambda r: r or "All rooms")
+    with col4:
+        action_filter = st.selectbox("Action", ["", "entry", "exit"], format_func=lambda a: a or "All actions")
+    with col5:
+        include_archive = st.checkbox("Include archived logs")
+    filters = {
+        'start': date_range[0] if len(date_range) > 0 else None,
+        'end': date_range[1] if len(date_range) > 1 else None,
+        'student': student_filter.strip() or None,
+        'room': room_filter or None,
+        'action': action_filter or None,
+    }
+
+    # Keyset pagination: remember the last row key of every page visited.
+    if st.session_state.get('logs_filters') != (filters, include_archive):
+        st.session_state.logs_filters = (filters, include_archive)
+        st.session_state.logs_cursors = [None]
+    cursors = st.session_state.logs_cursors
+    rows = query_logs_page(LOGS_PAGE_SIZE, cursors[-1], include_archive, **filters)
+    df = pd.DataFrame(rows, columns=LOG_COLUMNS)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("← Newer", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with page_col:
+        st.caption(f"Page {len(cursors)}")
+    with next_col:
+        if st.button("Older →", disabled=len(rows) < LOGS_PAGE_SIZE):
+            cursors.append((rows[-1][5], rows[-1][0]))
+            st.rerun()
+
+    st.write("Export the filtered logs:")
+    fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, format_func=str.upper)
+    if st.button("Prepare export"):
+        # Rows are streamed to a temporary file on disk, only when asked for.
+        # Streamlit keeps the download in memory, so it is capped at
+        # EXPORT_UI_MAX_ROWS and bigger exports are pointed at export.py.
+        data = None
+        with tempfile.TemporaryFile() as export_file:
+            with st.spinner("Exporting logs..."):
+                count = export_logs(fmt, export_file, include_archive=include_archive,
+                                    limit=EXPORT_UI_MAX_ROWS + 1, **filters)
+            if count > EXPORT_UI_MAX_ROWS:
+                st.warning(f"More than {EXPORT_UI_MAX_ROWS:,} rows match. Narrow the filters, "
+                           "or export them on the server with:")
+                st.code(export_command(fmt, include_archive, **filters), language="bash")
+            else:
+                export_file.seek(0)
+                data = export_file.read()
+        if data is not None:
+            mime, ext = EXPORT_FORMATS[fmt]
+            st.download_button(f"Download {count} rows as {fmt.upper()}", data, f"hostel_logs{ext}", mime=mime)
 
 #==UNKNOWN ENTRIES==
 elif page == "Unknown Entries":
     st.markdown('<div class="big-title">Visitors</div>', unsafe_allow_html=True)
-    unknown_folder = "unknown_entries"
+    VISITORS_PAGE_SIZE = 30
 
-    if os.path.exists(unknown_folder) and os.listdir(unknown_folder):
-        unknown_files = sorted(os.listdir(unknown_folder), reverse=True)[:30]  # Show latest 30
+    col1, col2 = st.columns(2)
+    with col1:
+        visitor_dates = st.date_input("Date range", value=(), key="visitor_dates")
+    with col2:
+        camera_filter = st.selectbox("Camera", [""] + sorted(get_visitor_cameras()),
+                                     format_func=lambda c: c or "All cameras")
+    visitor_filters = {
+        'start': visitor_dates[0] if len(visitor_dates) > 0 else None,
+        'end': visitor_dates[1] if len(visitor_dates) > 1 else None,
+        'camera': camera_filter or None,
+    }
+    if st.session_state.get('visitor_filters') != visitor_filters:
+        st.session_state.visitor_filters = visitor_filters
+        st.session_state.visitor_cursors = [None]
+    visitor_cursors = st.session_state.visitor_cursors
+    visitors = get_visitors_page(VISITORS_PAGE_SIZE, visitor_cursors[-1], **visitor_filters)
+
+    if visitors:
         cols = st.columns(5)
-        for i, filename in enumerate(unknown_files):
+        for i, (vid, first_seen, last_seen, hits, camera, cameras, actions, thumbnail) in enumerate(visitors):
             with cols[i % 5]:
-                img_path = os.path.join(unknown_folder, filename)
-                img = Image.open(img_path)
-                st.image(img, caption=filename, width=110)
+                caption = f"{first_seen[5:16]} – {last_seen[11:16]}, seen {hits}x at {cameras or 'camera'}"
+                if thumbnail:
+                    st.image(thumbnail, caption=caption, width=110)
+                else:
+                    st.caption(caption)
+                if st.checkbox("Show full snapshot", key=f"full_visitor_{vid}"):
+                    snapshot = get_snapshot_path(vid)
+                    if snapshot and os.path.exists(snapshot):
+                        st.image(snapshot)
                 # Optional: Show a delete button for admin
-                if st.button(f"Delete {filename}", key=f"del_{filename}"):
-                    os.remove(img_path)
+                if st.button("Delete", key=f"del_{vid}"):
+                    delete_visitor(vid)
+                    st.rerun()
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            if st.button("← Newer", disabled=len(visitor_cursors) == 1):
+                visitor_cursors.pop()
+                st.rerun()
+        with page_col:
+            st.caption(f"Page {len(visitor_cursors)}")
+        with next_col:
+            if st.button("Older →", disabled=len(visitors) < VISITORS_PAGE_SIZE):
+                visitor_cursors.append((visitors[-1][1], visitors[-1][0]))
+                st.rerun()
     else:
         st.info("No unknown faces detected yet.")
 
+#==SYSTEM HEALTH==
+elif page == "System Health":
+    st.markdown('<div class="big-title">System Health</div>', unsafe_allow_html=True)
+    if not metrics.ENABLED:
+        st.info("Metrics are disabled (HOSTELFACELOG_METRICS=0).")
+    # Cameras opened from this app, plus the headless worker's metrics file.
+    samples = metrics.parse(metrics.registry.render())
+    if os.path.exists(metrics.METRICS_FILE):
+        age = time.time() - os.path.getmtime(metrics.METRICS_FILE)
+        st.caption(f"Worker metrics from {metrics.METRICS_FILE}, updated {age:.0f}s ago.")
+        with open(metrics.METRICS_FILE) as f:
+            samples += [(name, dict(labels, source="worker"), value) for name, labels, value in metrics.parse(f.read())]
+    if st.button("Refresh"):
+        st.rerun()
+
+    def health_table(rows):
+        table = defaultdict(dict)
+        for name, labels, value in rows:
+            if name.endswith(("_sum", "_count")):
+                continue
+            column = name
+            if name.endswith("_seconds"):
+                column, value = name[:-len("_seconds")] + " ms", value * 1000
+            if 'quantile' in labels:
+                column += f" p{int(float(labels['quantile']) * 100)}"
+            table[labels.get('camera', labels.get('source', 'app'))][column] = round(value, 2)
+        return pd.DataFrame.from_dict(table, orient='index').sort_index(axis=1)
+
+    camera_rows = [s for s in samples if 'camera' in s[1]]
+    other_rows = [s for s in samples if 'camera' not in s[1]]
+    if camera_rows:
+        st.subheader("Cameras")
+        st.dataframe(health_table(camera_rows), use_container_width=True)
+    else:
+        st.info("No camera is running.")
+    if other_rows:
+        st.subheader("Database and gallery")
+        st.dataframe(health_table(other_rows), use_container_width=True)
+
 st.sidebar.markdown("""
     <hr style='margin:1.2em 0 0.5em 0; border: none; border-top: 2px solid #3b82f6;'>
     <div style='color: #6ee7b7; text-align:center; font-size:1.08em; font-weight:600; margin-top:0.6em; letter-spacing:1px;'>
@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import bisect
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set HOSTELFACELOG_METRICS=0 to turn instrumentation off; every call below
+# then returns a shared no-op object and records nothing.
+ENABLED = os.environ.get("HOSTELFACELOG_METRICS", "1") not in ("0", "false", "no", "")
+METRICS_FILE = "metrics.prom"
+PREFIX = "hostelfacelog_"
+QUANTILES = (0.5, 0.95, 0.99)
+# Latency summaries cover the most recent WINDOW observations.
+WINDOW = 1024
+_SAMPLE = re.compile(r'([^{\s]+)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'\s*([A-Za-z_][A-Za-z0-9_]*)="((?:[^"\\]|\\.)*)"\s*,?')
+_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n'}
+
+
+def _escape(value):
+    # Label values as the text format requires: \\, \" and \n.
+    return "".join(_ESCAPES.get(c, c) for c in str(value))
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+class Summary:
+    # Rolling latency distribution: quantiles over the last `window`
+    # observations plus all-time count and sum.
+    def __init__(self, window=WINDOW):
+        self._values = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+            self.sum += value
+
+    def quantiles(self, qs=QUANTILES):
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {q: 0.0 for q in qs}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in qs}
+
+
+class Rate:
+    # Events per second over the last `horizon` seconds (e.g. FPS).
+    def __init__(self, horizon=5.0):
+        self.horizon = horizon
+        self._times = collections.deque()
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def mark(self):
+        now = time.monotonic()
+        with self._lock:
+            self._times.append(now)
+            self.count += 1
+            while self._times[0] < now - self.horizon:
+                self._times.popleft()
+
+    def value(self):
+        now = time.monotonic()
+        with self._lock:
+            cutoff = bisect.bisect_left(self._times, now - self.horizon)
+            return (len(self._times) - cutoff) / self.horizon
+
+
+class _Timer:
+    __slots__ = ("summary", "start")
+
+    def __init__(self, summary):
+        self.summary = summary
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.summary.observe(time.perf_counter() - self.start)
+
+
+class _Null:
+    # Stands in for every metric when instrumentation is disabled.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def observe(self, value):
+        pass
+
+    def mark(self):
+        pass
+
+
+NULL = _Null()
+
+
+class Registry:
+    def __init__(self):
+        self._summaries = {}
+        self._rates = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def summary(self, name, **labels):
+        key = self._key(name, labels)
+        metric = self._summaries.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._summaries.setdefault(key, Summary())
+        return metric
+
+    def rate(self, name, **labels):
+        key = self._key(name, labels)
+        metric = self._rates.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._rates.setdefault(key, Rate())
+        return metric
+
+    def gauge(self, name, fn, **labels):
+        # fn is called at scrape time, so queue depths and drop counters
+        # cost nothing on the hot path.
+        with self._lock:
+            self._gauges[self._key(name, labels)] = fn
+
+    def remove(self, **labels):
+        # Drops every metric carrying these labels (e.g. a stopped camera).
+        match = set(labels.items())
+        with self._lock:
+            for table in (self._summaries, self._rates, self._gauges):
+                for key in [k for k in table if match <= set(k[1])]:
+                    del table[key]
+
+    def collect(self):
+        # [(name, labels dict, value)] in Prometheus sample form.
+        with self._lock:
+            summaries = list(self._summaries.items())
+            rates = list(self._rates.items())
+            gauges = list(self._gauges.items())
+        samples = []
+        for (name, labels), metric in summaries:
+            for q, v in metric.quantiles().items():
+                samples.append((name, dict(labels, quantile=str(q)), v))
+            samples.append((name + "_sum", dict(labels), metric.sum))
+            samples.append((name + "_count", dict(labels), metric.count))
+        for (name, labels), metric in rates:
+            samples.append((name, dict(labels), metric.value()))
+            samples.append((name + "_total", dict(labels), metric.count))
+        for (name, labels), fn in gauges:
+            try:
+                samples.append((name, dict(labels), float(fn())))
+            except Exception:
+                continue
+        return samples
+
+    def render(self):
+        # Prometheus text exposition format.
+        lines = []
+        for name, labels, value in self.collect():
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            lines.append(f"{PREFIX}{name}{{{label_text}}} {value:.6g}" if label_text else f"{PREFIX}{name} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def timer(name, **labels):
+    # with metrics.timer("detect_seconds", camera=...): ...
+    if not ENABLED:
+        return NULL
+    return _Timer(registry.summary(name, **labels))
+
+
+def observe(name, value, **labels):
+    if ENABLED:
+        registry.summary(name, **labels).observe(value)
+
+
+def rate(name, **labels):
+    return registry.rate(name, **labels) if ENABLED else NULL
+
+
+def gauge(name, fn, **labels):
+    if ENABLED:
+        registry.gauge(name, fn, **labels)
+
+
+def write_textfile(path=METRICS_FILE):
+    # Atomic, so a scraper (e.g. node_exporter's textfile collector) or the
+    # System Health page never reads a half-written file.
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    # Serves /metrics from a daemon thread; local-only by default.
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def parse(text):
+    # Prometheus text -> [(name, labels dict, value)], for the System Health page.
+    samples = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        m = _SAMPLE.match(line)
+        if m is None:
+            continue
+        name, label_text, value = m.groups()
+        labels = {k: _unescape(v) for k, v in _LABEL.findall(label_text or "")}
+        try:
+            samples.append((name[len(PREFIX):] if name.startswith(PREFIX) else name, labels, float(value)))
+        except ValueError:
+            continue
+    return samples
@@ -0,0 +1,270 @@
+import os
+import time
+import logging
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import metrics
+from database import add_log
+from face_utils import make_face_detector, detect_faces_mediapipe, encode_faces
+from tracker import FaceTracker
+from scheduler import FrameScheduler
+from visitors import VisitorClusterer
+
+log = logging.getLogger("hostelfacelog.pipeline")
+
+
+class DropOldestQueue:
+    # Bounded FIFO that never blocks the producer: when full, the oldest item
+    # is discarded so consumers always work on the freshest data.
+    def __init__(self, maxsize, on_drop=None):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        evicted = None
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                evicted = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        if evicted is not None and self.on_drop is not None:
+            self.on_drop(evicted)
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LatestFrameCapture(threading.Thread):
+    # Reads the source as fast as it delivers and keeps only the newest frame,
+    # so a slow consumer never sees frames queued up in the camera buffer.
+    def __init__(self, source):
+        super().__init__(daemon=True)
+        self.source = source
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._read_seq = 0
+        self._stopped = threading.Event()
+        self.dropped = 0
+        self.alive = True
+
+    def run(self):
+        cap = cv2.VideoCapture(self.source)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Recorded files are paced at their own frame rate instead of being
+        # decoded as fast as possible.
+        is_file = isinstance(self.source, str) and os.path.exists(self.source)
+        frame_gap = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 25.0) if is_file else 0.0
+        try:
+            while not self._stopped.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                with self._cond:
+                    if self._seq > self._read_seq:
+                        self.dropped += 1
+                    self._seq += 1
+                    self._frame = (self._seq, time.time(), frame)
+                    self._cond.notify_all()
+                if frame_gap:
+                    time.sleep(frame_gap)
+        finally:
+            cap.release()
+            with self._cond:
+                self.alive = False
+                self._cond.notify_all()
+
+    def read(self, after_seq, timeout=1.0):
+        # Returns (seq, capture_time, frame) newer than after_seq, or None.
+        with self._cond:
+            if self._seq <= after_seq and self.alive:
+                self._cond.wait(timeout)
+            if self._frame is None or self._seq <= after_seq:
+                return None
+            self._read_seq = self._seq
+            return self._frame
+
+    def stop(self):
+        self._stopped.set()
+
+
+class CameraPipeline:
+    # capture thread -> detection thread -> recognition workers -> results.
+    # Stages are joined by drop-oldest queues, so under load frames are
+    # skipped rather than delayed and end-to-end latency stays bounded.
+    # Encoding runs in a process pool, so throughput scales with cores, and
+    # only for faces the tracker says need (re-)identification.
+    def __init__(self, source, action, gallery, workers=None, tolerance=0.5, queue_size=2, tracker=None,
+                 executor=None, camera=None, visitors=None, scheduler=None):
+        self.action = action
+        self.camera = camera
+        self.gallery = gallery
+        self.tolerance = tolerance
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.capture = LatestFrameCapture(source)
+        self.jobs = DropOldestQueue(queue_size, on_drop=self._release_job)
+        self.results = DropOldestQueue(queue_size)
+        self.tracker = tracker or FaceTracker()
+        self.scheduler = scheduler or FrameScheduler()
+        # Unknown faces are clustered into visitors; pass one clusterer to
+        # several pipelines so a visitor seen by two cameras stays one record.
+        # Metrics are labelled per camera; webcam pipelines have no name.
+        self.label = camera or action
+        self._fps = metrics.rate("frames_per_second", camera=self.label)
+        self._owns_visitors = visitors is None
+        self.visitors = visitors or VisitorClusterer(tolerance)
+        self._stopped = threading.Event()
+        # A shared executor lets several cameras in one process draw from a
+        # single pool of encoding processes.
+        self._executor = executor
+        self._owns_executor = executor is None
+        # Set when the encoding pool dies; the pipeline then stops and the
+        # owner has to rebuild the pool (see worker.CameraSupervisor).
+        self.executor_broken = False
+        self._errors = metrics.rate("recognition_errors", camera=self.label)
+        self._threads = []
+
+    def start(self):
+        label = self.label
+        metrics.gauge("capture_dropped_frames", lambda: self.capture.dropped, camera=label)
+        metrics.gauge("job_queue_dropped", lambda: self.jobs.dropped, camera=label)
+        metrics.gauge("job_queue_depth", lambda: len(self.jobs), camera=label)
+        metrics.gauge("result_queue_depth", lambda: len(self.results), camera=label)
+        metrics.gauge("detections_skipped", lambda: self.scheduler.skipped, camera=label)
+        metrics.gauge("tracked_faces", lambda: len(self.tracker.tracks), camera=label)
+        if self._executor is None:
+            # Spawned: this process already runs capture and detection threads.
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        self.capture.start()
+        self._threads = [threading.Thread(target=self._detect_loop, daemon=True)]
+        self._threads += [threading.Thread(target=self._recognize_loop, daemon=True) for _ in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.capture.stop()
+        for t in self._threads:
+            t.join(timeout=2)
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._owns_visitors:
+            self.visitors.flush()
+        if metrics.ENABLED:
+            metrics.registry.remove(camera=self.label)
+
+    @property
+    def alive(self):
+        return (self.capture.alive and not self._stopped.is_set()
+                and all(t.is_alive() for t in self._threads))
+
+    def _detect_loop(self):
+        detector = make_face_detector()
+        seq = 0
+        while not self._stopped.is_set():
+            item = self.capture.read(seq)
+            if item is None:
+                if not self.capture.alive:
+                    break
+                continue
+            seq, captured_at, frame = item
+            if not self.scheduler.should_detect(frame, bool(self.tracker.tracks)):
+                # Nothing is moving: pass the frame through for display and
+                # let the capture thread drop frames while we wait.
+                self._finish({'seq': seq, 'captured_at': captured_at, 'frame': frame, 'tracks': [], 'pending': []})
+                self._stopped.wait(self.scheduler.wait_time())
+                continue
+            # MediaPipe boxes are relative, so detecting on the downscaled
+            # copy still yields full-resolution boxes for `frame`.
+            small_rgb = cv2.cvtColor(self.scheduler.downscale(frame), cv2.COLOR_BGR2RGB)
+            with metrics.timer("detect_seconds", camera=self.label):
+                boxes = detect_faces_mediapipe(frame, small_rgb, detector)
+            self.scheduler.record(len(boxes))
+            tracks = self.tracker.update(boxes)
+            pending = [t for t in tracks if self.tracker.claim_recognition(t)]
+            job = {'seq': seq, 'captured_at': captured_at, 'frame': frame, 'tracks': tracks, 'pending': pending}
+            if pending:
+                self.gallery.refresh()
+                job['rgb'] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.jobs.put(job)
+            else:
+                # Every face is already identified: skip the workers entirely.
+                self._finish(job)
+
+    def _release_job(self, job):
+        for track in job['pending']:
+            self.tracker.release(track)
+
+    def _recognize_loop(self):
+        while not self._stopped.is_set():
+            job = self.jobs.get(timeout=0.5)
+            if job is None:
+                continue
+            pending = job['pending']
+            try:
+                with metrics.timer("encode_seconds", camera=self.label):
+                    encodings = self._executor.submit(encode_faces, None, [t.box for t in pending],
+                                                      job.pop('rgb')).result()
+            except BrokenProcessPool:
+                self._release_job(job)
+                self._errors.mark()
+                log.error("camera %s: encoding pool is broken, stopping", self.label)
+                self.executor_broken = True
+                self._stopped.set()
+                break
+            except Exception:
+                # One bad frame (or a dlib error) must not end recognition
+                # for this camera; the faces are retried on a later frame.
+                self._release_job(job)
+                self._errors.mark()
+                log.exception("camera %s: encoding failed", self.label)
+                continue
+            encoded = [(t, enc) for t, enc in zip(pending, encodings) if enc is not None]
+            for track, enc in zip(pending, encodings):
+                if enc is None:
+                    self.tracker.release(track)
+            with metrics.timer("match_seconds", camera=self.label):
+                matches = self.gallery.match([enc for _, enc in encoded], self.tolerance) if encoded else []
+            for (track, enc), (sid, sname, dist) in zip(encoded, matches):
+                self.tracker.assign(track, sid, sname, dist)
+                if sid is None:
+                    track.visitor_id = self.visitors.observe(enc, job['frame'], track.box, self.action,
+                                                             self.camera).id
+            self._finish(job)
+
+    def _finish(self, job):
+        faces = []
+        for track in job['tracks']:
+            faces.append(self._handle_face(job['frame'], track))
+        job['faces'] = faces
+        job['latency'] = time.time() - job['captured_at']
+        metrics.observe("frame_latency_seconds", job['latency'], camera=self.label)
+        self._fps.mark()
+        self.results.put(job)
+
+    def _handle_face(self, frame, track):
+        face = {'box': track.box, 'track_id': track.id, 'student_id': track.student_id, 'name': track.name,
+                'distance': track.distance, 'visitor_id': track.visitor_id, 'logged': False}
+        if track.student_id is not None:
+            if self.tracker.claim_log(track):
+                face['logged'] = True
+                with metrics.timer("log_enqueue_seconds", camera=self.label):
+                    add_log(track.student_id, track.name, self.action, camera=self.camera)
+        return face
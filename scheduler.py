@@ -0,0 +1,90 @@
+import time
+import cv2
+
+
+class FrameScheduler:
+    # Decides which frames are worth running face detection on. A cheap
+    # motion gate (difference against a running-average background on a tiny
+    # grayscale copy) keeps an empty corridor from costing a detection per
+    # frame, and the detection rate follows activity:
+    #   faces tracked   -> every frame (active_interval)
+    #   motion, no face -> a few times a second (search_interval)
+    #   nothing        -> only on motion, plus a heartbeat every idle_interval
+    # While idle the caller is also told to sleep between motion checks, so
+    # an idle camera costs little more than decoding its stream.
+    def __init__(self, detect_width=640, motion_width=160, motion_threshold=0.005, pixel_delta=25,
+                 background_rate=0.05, active_interval=0.0, search_interval=0.2, idle_interval=2.0, idle_poll=0.2,
+                 cooldown=3.0):
+        # Detection runs on a copy no wider than detect_width; boxes come back
+        # in full-frame coordinates so encoding still uses full resolution.
+        self.detect_width = detect_width
+        self.motion_width = motion_width
+        # Fraction of motion pixels that counts as movement.
+        self.motion_threshold = motion_threshold
+        self.pixel_delta = pixel_delta
+        self.background_rate = background_rate
+        self.active_interval = active_interval
+        self.search_interval = search_interval
+        self.idle_interval = idle_interval
+        self.idle_poll = idle_poll
+        # Seconds after the last motion or face before the camera counts as idle.
+        self.cooldown = cooldown
+        self._background = None
+        self._last_detect = self._last_activity = self._last_face = float("-inf")
+        self.detected = 0
+        self.skipped = 0
+
+    def motion(self, frame):
+        # Fraction of pixels that differ from the background model.
+        h, w = frame.shape[:2]
+        scale = self.motion_width / float(w)
+        small = cv2.resize(frame, (self.motion_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self._background is None:
+            self._background = gray.astype("float32")
+            return 0.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        # The background follows slow lighting changes but not a person.
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+        _, mask = cv2.threshold(diff, self.pixel_delta, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    @property
+    def idle(self):
+        return time.monotonic() - self._last_activity > self.cooldown
+
+    def should_detect(self, frame, tracking=False, now=None):
+        now = time.monotonic() if now is None else now
+        if self.motion(frame) >= self.motion_threshold:
+            self._last_activity = now
+        if tracking:
+            self._last_activity = now
+        since = now - self._last_detect
+        if tracking or now - self._last_face <= self.cooldown:
+            due = since >= self.active_interval
+        elif now - self._last_activity <= self.cooldown:
+            due = since >= self.search_interval
+        else:
+            due = since >= self.idle_interval
+        if due:
+            self._last_detect = now
+            self.detected += 1
+        else:
+            self.skipped += 1
+        return due
+
+    def record(self, faces, now=None):
+        # Called with the number of faces the detector found.
+        if faces:
+            now = time.monotonic() if now is None else now
+            self._last_face = self._last_activity = now
+
+    def wait_time(self):
+        # How long the caller may sleep before looking at the next frame.
+        return self.idle_poll if self.idle else 0.0
+
+    def downscale(self, frame):
+        h, w = frame.shape[:2]
+        if w <= self.detect_width:
+            return frame
+        return cv2.resize(frame, (self.detect_width, int(h * self.detect_width / w)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    # A fresh database for this test, on this thread's connection.
+    import database
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.sqlite"))
+    monkeypatch.setattr(database, "_aggregate_cache", {})
+    # A writer of its own too: the thread's connection points at the old file.
+    monkeypatch.setattr(database, "_log_writer", None)
+    database._local.con = None
+    database.init_db()
+    yield database
+    database.get_connection().close()
+    database._local.con = None
@@ -0,0 +1,20 @@
+from batch_video import dedupe_sightings
+
+
+def test_sightings_within_window_are_one_event():
+    events = dedupe_sightings([
+        (1, "A", 10.0, 0.40),
+        (1, "A", 50.0, 0.30),
+        (1, "A", 100.0, 0.35),   # within 60 s of the previous sighting
+        (1, "A", 200.0, 0.45),   # a new pass
+        (2, "B", 20.0, 0.38),
+    ], window=60)
+    assert [(e['student_id'], e['position']) for e in events] == [(1, 10.0), (2, 20.0), (1, 200.0)]
+    assert events[0]['distance'] == 0.30
+
+
+def test_events_keep_their_source():
+    # Input order does not matter; each event reports its first sighting.
+    events = dedupe_sightings([(1, "A", 70.0, 0.3, "b.mp4", 10.0), (1, "A", 65.0, 0.4, "a.mp4", 65.0)])
+    assert len(events) == 1
+    assert events[0]['source'] == ["a.mp4", 65.0]
@@ -0,0 +1,86 @@
+import io
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def test_failed_write_leaves_no_open_transaction(temp_db):
+    # The connection lives for the whole thread, so a write that raises
+    # halfway must not hold the write lock against the log writer.
+    with pytest.raises(OSError):
+        temp_db.add_student("Asha", "R1", "101", np.zeros(128), b"not an image")
+    con = temp_db.get_connection()
+    assert not con.in_transaction
+    assert temp_db.get_gallery_version() == 0
+    temp_db.add_log(1, "Asha", "entry")
+    temp_db.flush_logs()
+    assert con.execute("SELECT COUNT(*) FROM logs").fetchone()[0] == 1
+
+
+def _insert(db, rows):
+    con = db.get_connection()
+    with con:
+        db._insert_logs(con, rows)
+
+
+def _presence(db):
+    return {r[0]: r[1:] for r in db.get_connection().execute(
+        "SELECT student_id, state, last_event_ts, last_camera FROM presence")}
+
+
+def test_presence_follows_the_latest_event(temp_db):
+    _insert(temp_db, [(1, "Asha", "entry", "2025-01-01 08:00:00", "gate-1"),
+                      (2, "Ravi", "entry", "2025-01-01 08:05:00", "gate-1"),
+                      (None, "Unknown", "entry", "2025-01-01 08:06:00", "gate-1")])
+    _insert(temp_db, [(1, "Asha", "exit", "2025-01-01 18:00:00", "gate-2")])
+    # A late backfill older than the recorded state leaves it alone.
+    _insert(temp_db, [(1, "Asha", "entry", "2025-01-01 12:00:00", "gate-1")])
+    expected = {1: ("exit", "2025-01-01 18:00:00", "gate-2"), 2: ("entry", "2025-01-01 08:05:00", "gate-1")}
+    assert _presence(temp_db) == expected
+    assert temp_db.get_last_action(1) == "exit"
+    assert temp_db.get_last_action(3) is None
+    assert temp_db.rebuild_presence(include_archive=False) == 2
+    assert _presence(temp_db) == expected
+
+
+def test_cached_aggregates_follow_new_logs_and_student_edits(temp_db, monkeypatch):
+    con = temp_db.get_connection()
+    with con:
+        con.executemany("INSERT INTO students (id, name, room) VALUES (?, ?, ?)",
+                        [(1, "Asha", "101"), (2, "Ravi", "102")])
+    _insert(temp_db, [(1, "Asha", "entry", "2025-01-01 08:00:00", None),
+                      (2, "Ravi", "entry", "2025-01-01 08:30:00", None)])
+    assert temp_db.get_action_counts("2025-01-01") == {"entry": 2}
+    assert temp_db.get_room_inside_counts() == {"101": 1, "102": 1}
+    # Within the TTL a repeat call is served from the cache.
+    _insert(temp_db, [(1, "Asha", "exit", "2025-01-01 09:00:00", None)])
+    assert temp_db.get_action_counts("2025-01-01") == {"entry": 2}
+    monkeypatch.setattr(temp_db, "AGGREGATE_TTL", 0.0)
+    assert temp_db.get_action_counts("2025-01-01") == {"entry": 2, "exit": 1}
+    assert temp_db.get_hourly_counts("2025-01-01", action="entry") == [("2025-01-01 08", "entry", 2)]
+    assert temp_db.get_room_inside_counts() == {"102": 1}
+    # A room change writes no log row but still refreshes the room counts.
+    temp_db.update_student(2, "Ravi", "R2", "103")
+    assert temp_db.get_room_inside_counts() == {"103": 1}
+
+
+def _photo(size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_listings_serve_thumbnails_and_keep_the_original(temp_db):
+    photo = _photo()
+    sid = temp_db.add_student("Asha", "R1", "101", np.zeros(128), photo)
+    [student] = temp_db.get_students_by_room("101")
+    assert set(student) == {'id', 'name', 'roll', 'room', 'thumbnail'}
+    thumb = Image.open(io.BytesIO(student['thumbnail']))
+    assert thumb.format == "JPEG" and max(thumb.size) == 160
+    assert temp_db.get_student_image(sid) == photo
+    # Rows from before thumbnails existed are backfilled from the original.
+    con = temp_db.get_connection()
+    with con:
+        con.execute("UPDATE students SET thumbnail = NULL")
+    assert temp_db.backfill_thumbnails() == 1
+    assert temp_db.get_students_by_room("101")[0]['thumbnail'] == student['thumbnail']
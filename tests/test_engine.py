@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+import engine
+from pipeline import DropOldestQueue
+
+
+class _Pipeline:
+    # Stands in for CameraPipeline: results are fed by the test.
+    instances = []
+
+    def __init__(self, source, action, gallery, executor=None, camera=None):
+        self.results = DropOldestQueue(8)
+        self.alive = True
+        self.stopped = False
+        _Pipeline.instances.append(self)
+
+    def start(self):
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+
+def _result(seq, faces):
+    return {'seq': seq, 'frame': np.zeros((60, 80, 3), dtype=np.uint8), 'faces': faces}
+
+
+def _face(track_id, student_id=None, logged=False):
+    return {'box': (5, 5, 30, 30), 'track_id': track_id, 'student_id': student_id,
+            'name': "Asha" if student_id else None, 'logged': logged}
+
+
+def _wait(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_viewers_share_one_engine_until_it_goes_idle(monkeypatch):
+    monkeypatch.setattr(engine, "CameraPipeline", _Pipeline)
+    monkeypatch.setattr(engine, "_engines", {})
+    first, last_event = engine.get_engine("entry", gallery=None, idle_timeout=0.2)
+    assert last_event == 0
+    pipeline = _Pipeline.instances[-1]
+    pipeline.results.put(_result(1, [_face(1, 7, logged=True), _face(2)]))
+    pipeline.results.put(_result(2, [_face(2)]))                 # same unknown track: announced once
+    assert _wait(lambda: len(first.events()) == 2)
+    assert [e['kind'] for e in first.events()] == ['logged', 'unknown']
+    seq, jpeg = first.frame(0)
+    assert jpeg[:2] == b"\xff\xd8"
+    # A second tab joins the running engine and sees only new events.
+    second, last_event = engine.get_engine("entry", gallery=None)
+    assert second is first and last_event == 2 and len(_Pipeline.instances) == 1
+    first.unsubscribe()
+    second.unsubscribe()
+    assert _wait(lambda: not first.alive)
+    assert pipeline.stopped and first.subscribe() is None
+    third, _ = engine.get_engine("entry", gallery=None)
+    assert third is not first and len(_Pipeline.instances) == 2
+    third.stop()
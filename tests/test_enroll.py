@@ -0,0 +1,33 @@
+import io
+import numpy as np
+import enroll
+
+
+def _manifest(lines):
+    return enroll.read_manifest(io.BytesIO(("name,roll,room,photo\n" + "\n".join(lines)).encode()))
+
+
+def test_duplicates_are_flagged_against_the_gallery_and_the_batch(temp_db, tmp_path, monkeypatch):
+    temp_db.add_students_bulk([("Asha", "R1", "101", np.zeros(128), b"", b"thumb")])
+    for name in ("a.jpg", "b.jpg", "c.jpg", "R5.jpg"):
+        (tmp_path / name).write_bytes(b"photo")
+    faces = {"R2": np.full(128, 0.01), "R3": np.full(128, 0.3), "R4": np.full(128, 0.301), "R5": np.full(128, 0.6)}
+
+    def fake_encode_all(jobs, source, workers, progress):
+        return {row['row']: (None, faces[row['roll']], b"thumb") for row, _ in jobs}
+    monkeypatch.setattr(enroll, "_encode_all", fake_encode_all)
+
+    rows = _manifest(["Asha again,R2,101,a.jpg", "Ravi,R3,102,b.jpg", "Ravi twin,R4,102,c.jpg",
+                      "Meena,R5,103,", "Repeat,R3,102,b.jpg", "No photo,R6,104,missing.jpg", ",R7,104,a.jpg"])
+    report = {e['row']: e for e in enroll.enroll(rows, enroll.PhotoSource(str(tmp_path)), workers=1)}
+    assert {row: (e['status'], e['reason']) for row, e in report.items()} == {
+        2: ('duplicate', "face matches an enrolled student"),
+        3: ('enrolled', None),
+        4: ('duplicate', "face matches row 3"),
+        5: ('enrolled', None),      # photo found by roll number
+        6: ('duplicate', "roll number already enrolled or repeated"),
+        7: ('rejected', "photo not found"),
+        8: ('rejected', "name, roll and room are required"),
+    }
+    assert report[2]['match_name'] == "Asha"
+    assert sorted(s['roll'] for s in temp_db.get_all_students()) == ["R1", "R3", "R5"]
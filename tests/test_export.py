@@ -0,0 +1,42 @@
+import io
+import csv
+from openpyxl import load_workbook
+import export
+
+
+def _rows(n):
+    return [(i, i, f"S{i}", "101", "entry", f"2025-01-01 08:00:{i:02d}", None) for i in range(n)]
+
+
+def test_xlsx_rolls_over_to_new_sheets():
+    buf = io.BytesIO()
+    assert export._export_xlsx(buf, iter([_rows(4), _rows(3)]), sheet_rows=3) == 7
+    wb = load_workbook(io.BytesIO(buf.getvalue()), read_only=True)
+    assert wb.sheetnames == ["Logs", "Logs (2)", "Logs (3)"]
+    sheets = [list(wb[name].values) for name in wb.sheetnames]
+    assert all(sheet[0] == tuple(export.LOG_COLUMNS) for sheet in sheets)
+    assert [len(sheet) - 1 for sheet in sheets] == [3, 3, 1]
+
+
+def test_empty_xlsx_still_has_a_header():
+    buf = io.BytesIO()
+    assert export._export_xlsx(buf, iter([])) == 0
+    assert list(load_workbook(io.BytesIO(buf.getvalue())).active.values) == [tuple(export.LOG_COLUMNS)]
+
+
+def test_csv_export_honours_limit_and_filters(temp_db):
+    con = temp_db.get_connection()
+    with con:
+        temp_db._insert_logs(con, [(i % 2, f"S{i % 2}", "entry", f"2025-01-01 08:{i:02d}:00", None)
+                                   for i in range(30)])
+    buf = io.BytesIO()
+    assert export.export_logs("csv", buf, chunk_size=4, limit=10, student=1) == 10
+    lines = list(csv.reader(io.StringIO(buf.getvalue().decode())))
+    assert lines[0] == export.LOG_COLUMNS
+    assert [line[1] for line in lines[1:]] == ["1"] * 10
+    assert lines[1][5] == "2025-01-01 08:29:00"
+
+
+def test_export_command_matches_the_filters():
+    assert export.export_command("xlsx", include_archive=True, room="A 1", action="exit") == \
+        "python export.py --format xlsx --room 'A 1' --action exit --include-archive"
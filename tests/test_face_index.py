@@ -0,0 +1,25 @@
+import numpy as np
+from face_index import IVFIndex, BruteForceIndex, measure_recall
+
+
+def _gallery(n_people=500, per_person=4, seed=0):
+    # Several noisy encodings per person, spread like dlib encodings.
+    rng = np.random.default_rng(seed)
+    people = rng.normal(0, 0.055, (n_people, 128)).astype(np.float32)
+    matrix = people[np.repeat(np.arange(n_people), per_person)] + rng.normal(0, 0.02, (n_people * per_person, 128))
+    return matrix.astype(np.float32), rng
+
+
+def test_ivf_recall_against_brute_force():
+    matrix, rng = _gallery()
+    queries = matrix[rng.integers(0, len(matrix), 200)] + rng.normal(0, 0.02, (200, 128)).astype(np.float32)
+    index = IVFIndex(n_probe=8, rerank=32).train(matrix)
+    assert measure_recall(index, matrix, queries)['recall'] >= 0.95
+
+
+def test_brute_force_finds_exact_neighbour():
+    matrix, _ = _gallery(50, 1)
+    index = BruteForceIndex()
+    ids, dists = index.search(index.build(matrix), matrix[[3, 17]], 1)
+    assert list(ids[:, 0]) == [3, 17]
+    assert np.allclose(dists[:, 0], 0, atol=1e-3)
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+import pytest
+from gallery import FaceGallery, LiveGallery, export_snapshot
+
+
+def _student(sid, value):
+    return {'id': sid, 'name': f"S{sid}", 'room': "101", 'encoding': np.full(128, value, dtype=np.float32)}
+
+
+def test_match_returns_nearest_within_tolerance():
+    gallery = FaceGallery([_student(1, 0.0), _student(2, 0.03), _student(3, 0.5)])
+    queries = [np.full(128, 0.025), np.full(128, 0.49), np.full(128, 0.25)]
+    results = gallery.match(queries, tolerance=0.5)
+    # Student 1 is also under tolerance for the first query, but 2 is nearer.
+    assert [r[0] for r in results] == [2, 3, None]
+    assert np.isclose(results[0][2], np.sqrt(128) * 0.005, atol=1e-4)
+    assert results[2][2] > 0.5
+    assert FaceGallery().match(queries[:2]) == [(None, None, None)] * 2
+    assert gallery.match([]) == []
+
+
+def test_apply_delta_adds_updates_and_removes():
+    gallery = FaceGallery([_student(1, 0.0), _student(2, 0.1), _student(3, 0.2)])
+    gallery.apply_delta([_student(2, 0.5), _student(4, 0.3)], removed_ids=[3])
+    assert sorted(gallery.ids.tolist()) == [1, 2, 4]
+    assert gallery.match([np.full(128, 0.5)])[0][0] == 2
+    assert gallery.match([np.full(128, 0.2)], tolerance=0.01)[0][0] is None
+
+
+def test_delete_after_load_at_version_zero(temp_db):
+    # Rows written before versioning existed (or a version-0 snapshot) leave
+    # the gallery at version 0; a delete afterwards must still take effect.
+    con = temp_db.get_connection()
+    with con:
+        for sid in (1, 2):
+            con.execute("INSERT INTO students (id, name, room, encoding) VALUES (?, ?, '101', ?)",
+                        (sid, f"S{sid}", temp_db.encoding_to_blob(np.full(128, sid / 10))))
+    gallery = LiveGallery(refresh_interval=0)
+    assert gallery.version == 0 and len(gallery) == 2
+    temp_db.delete_student(1)
+    assert gallery.refresh()
+    assert gallery.ids.tolist() == [2]
+    assert gallery.match([np.full(128, 0.1)], tolerance=0.01)[0][0] is None
+
+
+def test_snapshot_round_trip_and_mismatch(temp_db, tmp_path):
+    for sid in (1, 2, 3):
+        temp_db.add_students_bulk([(f"S{sid}", "R", "101", np.full(128, sid / 10), b"", b"thumb")])
+    path = str(tmp_path / "snap")
+    assert export_snapshot(path) == (3, 3)
+    gallery = FaceGallery.from_snapshot(path)
+    assert gallery.version == 3 and gallery.ids.tolist() == [1, 2, 3]
+    assert gallery.match([np.full(128, 0.2)])[0][0] == 2
+    temp_db.delete_student(2)
+    export_snapshot(path)
+    assert FaceGallery.from_snapshot(path).ids.tolist() == [1, 3]
+    # ids from one export paired with another export's matrix are refused.
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    meta['matrix'] = "snap.v3.npy"
+    with open(path + ".json", "w") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        FaceGallery.from_snapshot(path)
@@ -0,0 +1,14 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_modules_do_not_load_the_vision_stack():
+    # main.py imports these at startup; OpenCV, MediaPipe and dlib must wait
+    # until a camera or registration page asks for them.
+    code = ("import sys, database, gallery, face_index, visitors, export, archive, metrics, enroll; "
+            "print(' '.join(m for m in ('cv2', 'mediapipe', 'face_recognition', 'face_utils') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
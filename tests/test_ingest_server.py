@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from ingest_server import encode_batch, decode_batch, LogDeduper, PayloadError
+
+
+def test_batch_round_trip_float16():
+    vectors = np.random.default_rng(0).normal(0, 0.055, (3, 128))
+    body = encode_batch("gate-1", "exit", [1.0e9, 1.0e9 + 1, 1.0e9 + 2], vectors)
+    camera, action, times, embeddings = decode_batch(body)
+    assert (camera, action) == ("gate-1", "exit")
+    assert list(times) == [1.0e9, 1.0e9 + 1, 1.0e9 + 2]
+    assert embeddings.shape == (3, 128)
+    assert np.allclose(embeddings, vectors, atol=1e-3)
+
+
+def test_batch_round_trip_float32_is_exact():
+    vectors = np.random.default_rng(1).normal(0, 0.055, (2, 128)).astype(np.float32)
+    _, _, _, embeddings = decode_batch(encode_batch("g", "entry", [5.0, 6.0], vectors, np.float32))
+    assert np.array_equal(embeddings, vectors)
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda b: b[:10],                      # truncated header
+    lambda b: b"XXXX" + b[4:],             # bad magic
+    lambda b: b + b"\0",                   # trailing bytes
+    lambda b: b[:-1],                      # short body
+])
+def test_malformed_batches_are_rejected(mutate):
+    body = encode_batch("g", "entry", [5.0], np.zeros((1, 128)))
+    with pytest.raises(PayloadError):
+        decode_batch(mutate(body))
+
+
+@pytest.mark.parametrize("camera", ["", "gate 1", 'gate"1', "gate\n1", "x" * 65])
+def test_bad_camera_names_are_rejected(camera):
+    with pytest.raises(PayloadError):
+        decode_batch(encode_batch(camera, "entry", [5.0], np.zeros((1, 128))))
+
+
+def test_batch_size_limit():
+    body = encode_batch("g", "entry", np.arange(1, 5, dtype=float), np.zeros((4, 128)))
+    with pytest.raises(PayloadError):
+        decode_batch(body, max_batch=3)
+
+
+def test_deduper_window_and_out_of_order():
+    dedupe = LogDeduper(window=60)
+    assert dedupe.claim(1, "entry", 1000.0)
+    assert not dedupe.claim(1, "entry", 1030.0)   # same pass
+    assert not dedupe.claim(1, "entry", 990.0)    # late batch from another edge
+    assert dedupe.claim(1, "exit", 1030.0)        # other role
+    assert dedupe.claim(2, "entry", 1030.0)       # other student
+    assert dedupe.claim(1, "entry", 1100.0)       # next pass
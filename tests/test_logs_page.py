@@ -0,0 +1,29 @@
+def _insert(db, rows):
+    con = db.get_connection()
+    with con:
+        db._insert_logs(con, rows)
+
+
+def test_keyset_pages_cover_every_row_once(temp_db):
+    # Several rows per second, so the id tie-break matters.
+    _insert(temp_db, [(i % 3, f"S{i % 3}", "entry" if i % 2 else "exit",
+                       f"2025-01-01 10:00:{i // 4:02d}", None) for i in range(50)])
+    seen, before = [], None
+    while True:
+        page = temp_db.get_logs_page(7, before)
+        if not page:
+            break
+        seen += page
+        before = (page[-1][5], page[-1][0])
+    keys = [(r[5], r[0]) for r in seen]
+    assert len(seen) == 50
+    assert keys == sorted(keys, reverse=True)
+    assert len(set(keys)) == 50
+
+
+def test_filters_apply_to_pages(temp_db):
+    _insert(temp_db, [(1, "Asha", "entry", "2025-01-01 08:00:00", None),
+                      (2, "Ravi", "entry", "2025-01-02 08:00:00", None),
+                      (1, "Asha", "exit", "2025-01-02 09:00:00", None)])
+    rows = temp_db.get_logs_page(10, start="2025-01-02", student="asha")
+    assert [(r[2], r[4]) for r in rows] == [("Asha", "exit")]
@@ -0,0 +1,22 @@
+import metrics
+
+
+def test_render_parse_round_trip_with_awkward_labels():
+    registry = metrics.Registry()
+    camera = 'gate "A", back\\door\nnorth'
+    registry.summary("detect_seconds", camera=camera).observe(0.25)
+    registry.gauge("queue_depth", lambda: 3, camera="plain")
+    text = registry.render()
+    assert len(text.splitlines()) == 6
+    samples = {(name, tuple(sorted(labels.items()))): value for name, labels, value in metrics.parse(text)}
+    assert samples[("detect_seconds_count", (("camera", camera),))] == 1
+    assert samples[("detect_seconds", (("camera", camera), ("quantile", "0.5")))] == 0.25
+    assert samples[("queue_depth", (("camera", "plain"),))] == 3
+
+
+def test_remove_drops_a_cameras_metrics():
+    registry = metrics.Registry()
+    registry.rate("fps", camera="a").mark()
+    registry.rate("fps", camera="b").mark()
+    registry.remove(camera="a")
+    assert {labels["camera"] for _, labels, _ in registry.collect()} == {"b"}
@@ -0,0 +1,36 @@
+import numpy as np
+from scheduler import FrameScheduler
+
+
+def _still():
+    return np.full((240, 320, 3), 90, dtype=np.uint8)
+
+
+def _moving():
+    frame = _still()
+    frame[60:180, 100:220] = 250
+    return frame
+
+
+def test_detection_rate_follows_activity():
+    s = FrameScheduler(search_interval=0.2, idle_interval=2.0, cooldown=3.0)
+    assert s.should_detect(_still(), now=100.0)          # first frame: nothing detected yet
+    # An empty corridor: only the idle heartbeat.
+    assert not s.should_detect(_still(), now=101.0)
+    assert s.should_detect(_still(), now=102.1)
+    # Motion: a few detections a second.
+    assert not s.should_detect(_moving(), now=102.2)
+    assert s.should_detect(_moving(), now=102.35)
+    assert not s.should_detect(_moving(), now=102.4)
+    # A face is tracked: every frame.
+    s.record(1, now=102.4)
+    assert s.should_detect(_still(), tracking=True, now=102.41)
+    assert s.should_detect(_still(), tracking=True, now=102.42)
+    assert (s.detected, s.skipped) == (5, 3)
+
+
+def test_downscale_caps_width_and_keeps_aspect():
+    s = FrameScheduler(detect_width=640)
+    assert s.downscale(np.zeros((1080, 1920, 3), dtype=np.uint8)).shape == (360, 640, 3)
+    small = np.zeros((240, 320, 3), dtype=np.uint8)
+    assert s.downscale(small) is small
@@ -0,0 +1,50 @@
+from tracker import FaceTracker, iou
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (10, 10, 20, 20)) == 0.0
+    assert abs(iou((0, 0, 10, 10), (5, 0, 15, 10)) - 1 / 3) < 1e-9
+
+
+def test_tracks_follow_boxes_and_expire():
+    tracker = FaceTracker(max_missed=2)
+    a, b = tracker.update([(0, 0, 100, 100), (300, 0, 400, 100)])
+    # Listed in the other order and moved a little: same tracks.
+    b2, a2 = tracker.update([(305, 0, 405, 100), (5, 5, 105, 105)])
+    assert (a2.id, b2.id) == (a.id, b.id)
+    for _ in range(3):
+        tracker.update([(0, 0, 100, 100)])
+    assert set(tracker.tracks) == {a.id}
+    [c] = tracker.update([(600, 0, 700, 100)])
+    assert c.id not in (a.id, b.id)
+
+
+def test_each_appearance_is_encoded_once_then_reverified():
+    tracker = FaceTracker(reverify_every=3, confident_distance=0.4)
+    [track] = tracker.update([(0, 0, 100, 100)])
+    assert tracker.claim_recognition(track)
+    assert not tracker.claim_recognition(track)          # a worker has it
+    tracker.assign(track, 7, "Asha", 0.3)
+    tracker.update([(0, 0, 100, 100)])
+    assert not tracker.claim_recognition(track)
+    for _ in range(2):
+        tracker.update([(0, 0, 100, 100)])
+    assert tracker.claim_recognition(track)              # reverify_every frames later
+    tracker.assign(track, 7, "Asha", 0.45)
+    assert tracker.claim_recognition(track)              # weak match: sooner
+    tracker.release(track)
+    assert tracker.claim_recognition(track)
+
+
+def test_logging_is_debounced_per_student():
+    tracker = FaceTracker(relog_after=60.0)
+    [track] = tracker.update([(0, 0, 100, 100)])
+    assert not tracker.claim_log(track)                  # not identified yet
+    tracker.assign(track, 7, "Asha", 0.3)
+    assert tracker.claim_log(track)
+    assert not tracker.claim_log(track)
+    # Lost and re-acquired within relog_after: no second row.
+    [again] = tracker.update([(500, 0, 600, 100)])
+    tracker.assign(again, 7, "Asha", 0.3)
+    assert not tracker.claim_log(again)
@@ -0,0 +1,69 @@
+import numpy as np
+from visitors import VisitorClusterer
+
+
+class _Writer:
+    def __init__(self):
+        self.puts = []
+
+    def put(self, record, crop=None):
+        self.puts.append((record, crop))
+
+    def flush(self, timeout=5.0):
+        pass
+
+
+def _frame(contrast):
+    # Snapshot quality is the Laplacian variance, so contrast ranks crops.
+    frame = np.full((120, 120, 3), 100, dtype=np.uint8)
+    frame[::2, ::2] += contrast
+    return frame
+
+
+def test_one_visitor_per_person_with_the_best_snapshot():
+    writer = _Writer()
+    clusters = VisitorClusterer(threshold=0.5, min_interval=5.0, record_interval=30.0, writer=writer)
+    a, b = np.zeros(128), np.full(128, 0.1)
+    first = clusters.observe(a, _frame(20), (10, 10, 100, 100), "entry", "gate-1", now=1000.0)
+    assert clusters.observe(a + 0.01, _frame(100), (10, 10, 100, 100), now=1001.0) is first
+    assert first.hits == 1                       # within min_interval: last_seen only
+    assert clusters.observe(a + 0.01, _frame(100), (10, 10, 100, 100), "exit", "gate-2", now=1010.0) is first
+    assert first.hits == 2 and first.cameras == ["gate-1", "gate-2"] and first.actions == ["entry", "exit"]
+    assert clusters.observe(a, _frame(20), (10, 10, 100, 100), now=1020.0) is first
+    other = clusters.observe(b, _frame(20), (10, 10, 100, 100), now=1021.0)
+    assert other is not first and len(clusters) == 2
+    # New visitors and better crops come with a snapshot; worse ones don't.
+    snapshots = [record['id'] for record, crop in writer.puts if crop is not None]
+    assert snapshots == [first.id, first.id, other.id]
+    assert len(first.id) == 32
+
+
+def test_idle_clusters_are_forgotten_and_flushed():
+    writer = _Writer()
+    clusters = VisitorClusterer(window=60.0, writer=writer)
+    old = clusters.observe(np.zeros(128), _frame(20), (0, 0, 50, 50), now=0.0)
+    clusters.observe(np.zeros(128), _frame(20), (0, 0, 50, 50), now=2.0)
+    writer.puts.clear()
+    clusters.flush()
+    assert [record['last_seen'] for record, _ in writer.puts] == [old.record()['last_seen']]
+    assert clusters.observe(np.zeros(128), _frame(20), (0, 0, 50, 50), now=100.0) is not old
+    assert len(clusters) == 1
+
+
+def _visitor(vid, first_seen, cameras):
+    return {'id': vid, 'first_seen': first_seen, 'last_seen': first_seen, 'hits': 1,
+            'cameras': cameras, 'actions': ['entry']}
+
+
+def test_visitor_pages_and_counts(temp_db):
+    con = temp_db.get_connection()
+    with con:
+        temp_db.upsert_visitors(con, [_visitor("a", "2025-01-01 08:00:00", ["gate-1"]),
+                                      _visitor("b", "2025-01-02 08:00:00", ["gate-2", "gate-1"]),
+                                      _visitor("c", "2025-01-02 09:00:00", [])])
+    assert temp_db.count_visitors(None) == 3
+    assert temp_db.count_visitors("2025-01-02") == 2
+    assert temp_db.count_visitors(None, camera="gate-1") == 1
+    page = temp_db.get_visitors_page(2)
+    assert [r[0] for r in page] == ["c", "b"]
+    assert [r[0] for r in temp_db.get_visitors_page(2, (page[-1][1], page[-1][0]))] == ["a"]
@@ -0,0 +1,119 @@
+import time
+import threading
+import itertools
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+        self.student_id = None
+        self.name = None
+        self.distance = None
+        self.verified_at = None
+        self.pending = False
+        self.logged = False
+        self.visitor_id = None
+
+
+class FaceTracker:
+    # Greedy IoU tracker over detect_faces_mediapipe boxes. A person standing
+    # at the gate keeps one track, so they are encoded when the track starts
+    # and then only re-verified every reverify_every frames, or sooner while
+    # the match is weak. Logging is debounced per track instead of per session.
+    def __init__(self, iou_threshold=0.3, max_missed=8, reverify_every=15, confident_distance=0.4,
+                 relog_after=60.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_every = reverify_every
+        self.confident_distance = confident_distance
+        # A track that is lost and re-acquired for the same student within
+        # this many seconds does not produce a second log row.
+        self.relog_after = relog_after
+        self.tracks = {}
+        self.frame_no = 0
+        self._ids = itertools.count(1)
+        self._last_logged = {}
+        self._lock = threading.Lock()
+
+    def update(self, boxes):
+        # Returns the tracks for `boxes`, in the same order.
+        with self._lock:
+            self.frame_no += 1
+            pairs = sorted(((iou(t.box, b), tid, i) for tid, t in self.tracks.items() for i, b in enumerate(boxes)),
+                           reverse=True)
+            assigned = [None] * len(boxes)
+            used = set()
+            for score, tid, i in pairs:
+                if score < self.iou_threshold:
+                    break
+                if tid in used or assigned[i] is not None:
+                    continue
+                used.add(tid)
+                assigned[i] = self.tracks[tid]
+            for i, box in enumerate(boxes):
+                if assigned[i] is None:
+                    track = Track(next(self._ids), box)
+                    self.tracks[track.id] = track
+                    assigned[i] = track
+                    used.add(track.id)
+                assigned[i].box = box
+                assigned[i].missed = 0
+            for tid in list(self.tracks):
+                if tid not in used:
+                    self.tracks[tid].missed += 1
+                    if self.tracks[tid].missed > self.max_missed:
+                        del self.tracks[tid]
+            return assigned
+
+    def claim_recognition(self, track):
+        # True if the track should be (re-)encoded now; marks it pending so the
+        # next frames don't queue duplicate work while a worker is busy.
+        with self._lock:
+            if track.pending:
+                return False
+            due = (track.verified_at is None
+                   or self.frame_no - track.verified_at >= self.reverify_every
+                   or (track.student_id is not None and track.distance > self.confident_distance))
+            if due:
+                track.pending = True
+            return due
+
+    def assign(self, track, student_id, name, distance):
+        with self._lock:
+            track.pending = False
+            track.verified_at = self.frame_no
+            if student_id != track.student_id:
+                track.logged = False
+            if student_id is not None:
+                track.visitor_id = None
+            track.student_id, track.name, track.distance = student_id, name, distance
+
+    def release(self, track):
+        with self._lock:
+            track.pending = False
+
+    def claim_log(self, track):
+        # True exactly once per identified track (subject to relog_after).
+        with self._lock:
+            if track.student_id is None or track.logged:
+                return False
+            track.logged = True
+            now = time.time()
+            last = self._last_logged.get(track.student_id)
+            if last is not None and now - last < self.relog_after:
+                return False
+            self._last_logged[track.student_id] = now
+            return True
@@ -0,0 +1,321 @@
+import os
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+import numpy as np
+from database import init_db, get_connection, upsert_visitors
+from image_utils import make_thumbnail
+
+log = logging.getLogger("hostelfacelog.visitors")
+
+UNKNOWN_FOLDER = "unknown_entries"
+
+
+def snapshot_quality(crop):
+    # Larger and sharper crops make better snapshots: face area weighted by
+    # the variance of the Laplacian (a cheap focus measure).
+    import cv2
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(gray.shape[0] * gray.shape[1]) * float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class Visitor:
+    def __init__(self, encoding, now):
+        # The full 128 bits: the id is the visitors primary key and an upsert
+        # on a collision would silently merge two people.
+        self.id = uuid.uuid4().hex
+        self.centroid = np.asarray(encoding, dtype=np.float64)
+        self.first_seen = now
+        self.last_seen = now
+        self.last_hit = now
+        self.hits = 1
+        self.quality = 0.0
+        self.cameras = []
+        self.actions = []
+        self.record_written = 0.0
+
+    def record(self):
+        fmt = '%Y-%m-%d %H:%M:%S'
+        return {'id': self.id, 'first_seen': datetime.datetime.fromtimestamp(self.first_seen).strftime(fmt),
+                'last_seen': datetime.datetime.fromtimestamp(self.last_seen).strftime(fmt), 'hits': self.hits,
+                'cameras': list(self.cameras), 'actions': list(self.actions)}
+
+
+class VisitorClusterer:
+    # Rolling in-memory store of unknown faces. Encodings within `threshold`
+    # of a cluster centroid are the same visitor, so one person at the gate
+    # yields one snapshot (the best one seen so far) and one row in the
+    # visitors table instead of a file per frame. Clusters idle for longer than `window`
+    # seconds are forgotten; a sighting within `min_interval` of the last
+    # counted one only refreshes last_seen.
+    def __init__(self, threshold=0.5, window=3600.0, max_clusters=500, min_interval=5.0, record_interval=30.0,
+                 min_gain=1.2, writer=None):
+        self.threshold = threshold
+        self.window = window
+        self.max_clusters = max_clusters
+        self.min_interval = min_interval
+        self.record_interval = record_interval
+        # A new snapshot replaces the stored one only if it is this much better.
+        self.min_gain = min_gain
+        self.writer = writer
+        self.visitors = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.visitors)
+
+    def _evict(self, now):
+        self.visitors = [v for v in self.visitors if now - v.last_seen <= self.window]
+        if len(self.visitors) >= self.max_clusters:
+            self.visitors.sort(key=lambda v: v.last_seen, reverse=True)
+            del self.visitors[self.max_clusters - 1:]
+
+    def _nearest(self, encoding):
+        if not self.visitors:
+            return None
+        centroids = np.stack([v.centroid for v in self.visitors])
+        dists = np.linalg.norm(centroids - encoding, axis=1)
+        best = int(np.argmin(dists))
+        return self.visitors[best] if dists[best] <= self.threshold else None
+
+    def observe(self, encoding, frame, box, action=None, camera=None, now=None):
+        # Returns the visitor this sighting belongs to.
+        now = time.time() if now is None else now
+        encoding = np.asarray(encoding, dtype=np.float64)
+        x1, y1, x2, y2 = box
+        crop = frame[max(0, y1):y2, max(0, x1):x2]
+        with self._lock:
+            self._evict(now)
+            visitor = self._nearest(encoding)
+            if visitor is None:
+                visitor = Visitor(encoding, now)
+                self.visitors.append(visitor)
+            else:
+                visitor.last_seen = now
+                if now - visitor.last_hit < self.min_interval:
+                    return visitor
+                visitor.last_hit = now
+                visitor.hits += 1
+                # Running mean, so the centroid follows slow changes in pose and light.
+                visitor.centroid += (encoding - visitor.centroid) / min(visitor.hits, 20)
+            if camera and camera not in visitor.cameras:
+                visitor.cameras.append(camera)
+            if action and action not in visitor.actions:
+                visitor.actions.append(action)
+            quality = snapshot_quality(crop)
+            save_snapshot = quality > visitor.quality * self.min_gain
+            if save_snapshot:
+                visitor.quality = quality
+            save_record = save_snapshot or now - visitor.record_written >= self.record_interval
+            if save_record:
+                visitor.record_written = now
+            record = visitor.record() if save_record else None
+        if save_record:
+            self._writer().put(record, crop.copy() if save_snapshot else None)
+        return visitor
+
+    def flush(self, timeout=5.0):
+        # Saves the records that changed since they were last queued.
+        with self._lock:
+            stale = [v.record() for v in self.visitors if v.last_seen > v.record_written]
+            for v in self.visitors:
+                v.record_written = max(v.record_written, v.last_seen)
+        writer = self._writer()
+        for record in stale:
+            writer.put(record)
+        writer.flush(timeout)
+
+    def _writer(self):
+        return self.writer or _get_visitor_writer()
+
+
+def snapshot_path(folder, record):
+    # Date-sharded, so no directory grows without bound: folder/YYYY/MM/DD/.
+    day = record['first_seen'][:10]
+    stamp = record['first_seen'].replace('-', '').replace(':', '').replace(' ', '_')
+    return os.path.join(folder, *day.split('-'), f"visitor.{stamp}.{record['id']}.jpg")
+
+
+class VisitorWriter(threading.Thread):
+    # Writes snapshots, thumbnails and visitor rows off the camera threads.
+    # Updates for the same visitor within one batch collapse to the latest.
+    def __init__(self, folder=UNKNOWN_FOLDER, flush_interval=0.5, max_pending=1000):
+        super().__init__(name="visitor-writer", daemon=True)
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+    def put(self, record, crop=None):
+        # Never blocks a camera: a dropped record is superseded by the next
+        # one for the same visitor.
+        try:
+            self._queue.put_nowait((record, crop))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            records, crops, waiters = {}, {}, []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                record, crop = item
+                records[record['id']] = record
+                if crop is not None:
+                    crops[record['id']] = (record, crop)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if records:
+                try:
+                    self._write(records, crops)
+                except Exception:
+                    log.exception("failed to save %d visitor records", len(records))
+            for w in waiters:
+                w.set()
+
+    def _write(self, records, crops, attempts=3):
+        import cv2
+        snapshots = []
+        for vid, (record, crop) in crops.items():
+            ok, buf = cv2.imencode(".jpg", crop)
+            if not ok:
+                continue
+            path = snapshot_path(self.folder, record)
+            _write_file(path, buf.tobytes())
+            snapshots.append((vid, path, make_thumbnail(buf.tobytes())))
+        con = get_connection()
+        for attempt in range(attempts):
+            try:
+                with con:
+                    upsert_visitors(con, list(records.values()), snapshots)
+                return
+            except sqlite3.OperationalError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.5)
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+_visitor_writer = None
+_visitor_writer_lock = threading.Lock()
+
+
+def _get_visitor_writer():
+    global _visitor_writer
+    if _visitor_writer is None:
+        with _visitor_writer_lock:
+            if _visitor_writer is None:
+                writer = VisitorWriter()
+                writer.start()
+                atexit.register(writer.flush)
+                _visitor_writer = writer
+    return _visitor_writer
+
+
+def get_snapshot_path(visitor_id):
+    row = get_connection().execute("SELECT snapshot FROM visitors WHERE id=?", (visitor_id,)).fetchone()
+    return row[0] if row else None
+
+
+def delete_visitor(visitor_id):
+    # Row and file go together: the snapshot is moved aside, the row deleted,
+    # and the file only unlinked once the delete has committed. If the
+    # transaction fails the snapshot is put back.
+    con = get_connection()
+    path = trash = None
+    try:
+        with con:
+            row = con.execute("SELECT snapshot FROM visitors WHERE id=?", (visitor_id,)).fetchone()
+            if row is None:
+                return False
+            con.execute("DELETE FROM visitors WHERE id=?", (visitor_id,))
+            path = row[0]
+            if path and os.path.exists(path):
+                trash = path + ".deleted"
+                os.replace(path, trash)
+    except Exception:
+        if trash is not None:
+            os.replace(trash, path)
+        raise
+    if trash is not None:
+        os.remove(trash)
+    return True
+
+
+def import_legacy_snapshots(folder=UNKNOWN_FOLDER):
+    # Indexes the flat visitor*.jpg files written before the visitors table
+    # (one per frame, no record) and moves them into the date-sharded layout.
+    con = get_connection()
+    imported = 0
+    names = [f for f in os.listdir(folder) if f.startswith("visitor") and f.endswith(".jpg")] \
+        if os.path.isdir(folder) else []
+    for name in sorted(names):
+        parts = name.split(".")
+        try:
+            seen = datetime.datetime.strptime(parts[1], "%Y%m%d_%H%M%S").strftime('%Y-%m-%d %H:%M:%S')
+        except (IndexError, ValueError):
+            continue
+        src = os.path.join(folder, name)
+        action = "exit" if parts[0] == "visitor_exit" else "entry"
+        record = {'id': parts[2] if len(parts) > 3 else uuid.uuid4().hex, 'first_seen': seen, 'last_seen': seen,
+                  'hits': 1, 'cameras': [], 'actions': [action]}
+        with open(src, "rb") as f:
+            data = f.read()
+        try:
+            thumbnail = make_thumbnail(data)
+        except OSError:
+            log.warning("skipping unreadable snapshot %s", src)
+            continue
+        path = snapshot_path(folder, record)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with con:
+            upsert_visitors(con, [record], [(record['id'], path, thumbnail)])
+            os.replace(src, path)
+        sidecar = src[:-4] + ".json"
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        imported += 1
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Visitor snapshot maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import-legacy", help=f"index flat snapshots left in {UNKNOWN_FOLDER}/")
+    args = parser.parse_args()
+    init_db()
+    if args.command == "import-legacy":
+        print(f"Imported {import_legacy_snapshots()} snapshots")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import time
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+import metrics
+from database import init_db, flush_logs
+from gallery import LiveGallery
+from face_index import load_index
+from pipeline import CameraPipeline
+from visitors import VisitorClusterer
+from scheduler import FrameScheduler
+
+log = logging.getLogger("hostelfacelog.worker")
+
+ROLES = ("entry", "exit")
+
+
+def parse_source(source):
+    # "0" or 0 is a local device index; anything else (RTSP/HTTP URL or a
+    # video file path) goes to cv2.VideoCapture unchanged.
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def load_config(path):
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    cameras = config.get('cameras') or []
+    if not cameras:
+        raise SystemExit(f"{path}: no cameras configured")
+    for i, cam in enumerate(cameras):
+        cam.setdefault('name', f"camera-{i + 1}")
+        if cam.get('role') not in ROLES:
+            raise SystemExit(f"{path}: camera {cam['name']!r} needs role 'entry' or 'exit'")
+        if 'source' not in cam:
+            raise SystemExit(f"{path}: camera {cam['name']!r} has no source")
+        cam['source'] = parse_source(cam['source'])
+    return config
+
+
+class SharedExecutor:
+    # The encoding pool every camera draws from. One dead worker process
+    # breaks a whole ProcessPoolExecutor, so a broken pool is replaced and
+    # the cameras restart their pipelines on the new one.
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = self._new_pool()
+        self._lock = threading.Lock()
+        self._rebuilds = metrics.rate("executor_rebuilds")
+
+    def _new_pool(self):
+        # Spawned, not forked: by the time a pool is (re)built the camera,
+        # MediaPipe and log-writer threads are running, and a forked child
+        # can inherit a lock one of them held and hang on it.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @property
+    def broken(self):
+        return bool(getattr(self.pool, "_broken", False))
+
+    def rebuild(self, old):
+        # Only the first caller holding the broken pool replaces it.
+        with self._lock:
+            if self.pool is old:
+                log.error("encoding pool is broken; starting a new one")
+                old.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._new_pool()
+                self._rebuilds.mark()
+            return self.pool
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class CameraSupervisor(threading.Thread):
+    # Keeps one camera's pipeline running. Live sources (devices, streams)
+    # are reopened with backoff when they drop; a video file ends the camera.
+    # A pipeline whose threads died is restarted the same way, and one on a
+    # replaced encoding pool is restarted at once.
+    def __init__(self, cam, gallery, executors, tolerance, stop_event, visitors=None):
+        super().__init__(name=f"camera-{cam['name']}", daemon=True)
+        self.cam = cam
+        self.gallery = gallery
+        self.visitors = visitors
+        self.executors = executors
+        self.tolerance = tolerance
+        self.stop_event = stop_event
+
+    def run(self):
+        source = self.cam['source']
+        is_file = isinstance(source, str) and os.path.exists(source)
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            log.info("starting %s camera %s (%s)", self.cam['role'], self.cam['name'], source)
+            executor = self.executors.pool
+            pipeline = CameraPipeline(source, self.cam['role'], self.gallery, workers=self.cam.get('workers'),
+                                      tolerance=self.cam.get('tolerance', self.tolerance),
+                                      executor=executor, camera=self.cam['name'],
+                                      visitors=self.visitors,
+                                      scheduler=FrameScheduler(**(self.cam.get('scheduler') or {}))).start()
+            started = time.monotonic()
+            while pipeline.alive and executor is self.executors.pool and not self.stop_event.is_set():
+                self.stop_event.wait(1.0)
+            pipeline.stop()
+            if pipeline.executor_broken:
+                self.executors.rebuild(executor)
+            if self.stop_event.is_set():
+                break
+            if executor is not self.executors.pool:
+                if is_file:
+                    log.error("camera %s stopped: the encoding pool broke mid-file", self.cam['name'])
+                    break
+                log.warning("camera %s restarting on the new encoding pool", self.cam['name'])
+                continue
+            if is_file:
+                break
+            # A stream that ran for a while resets the backoff.
+            backoff = 1.0 if time.monotonic() - started > 60 else min(backoff * 2, 60.0)
+            log.warning("camera %s lost its source; reconnecting in %.0fs", self.cam['name'], backoff)
+            self.stop_event.wait(backoff)
+        log.info("camera %s stopped", self.cam['name'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-camera recognition worker.")
+    parser.add_argument("--config", default="cameras.yaml", help="YAML file listing the cameras")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="encoding processes shared by all cameras (default: CPU count - 1)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", default=metrics.METRICS_FILE,
+                        help="Prometheus text file rewritten every few seconds ('' to disable)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s: %(message)s")
+
+    config = load_config(args.config)
+    init_db()
+    gallery = LiveGallery(index=load_index(), snapshot=config.get('gallery_snapshot'))
+    workers = args.workers or config.get('workers') or max(1, (os.cpu_count() or 2) - 1)
+    executors = SharedExecutor(workers)
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    tolerance = config.get('tolerance', 0.5)
+    visitors = VisitorClusterer(tolerance)
+    supervisors = [CameraSupervisor(cam, gallery, executors, tolerance, stop_event, visitors)
+                   for cam in config['cameras']]
+    for sup in supervisors:
+        sup.start()
+    log.info("running %d camera(s) with %d encoding process(es), %d students in gallery",
+             len(supervisors), workers, len(gallery))
+    metrics.gauge("gallery_size", lambda: len(gallery))
+    if args.metrics_port and metrics.ENABLED:
+        metrics.serve(args.metrics_port)
+        log.info("metrics on http://127.0.0.1:%d/metrics", args.metrics_port)
+    last_metrics = 0.0
+    try:
+        while not stop_event.is_set() and any(sup.is_alive() for sup in supervisors):
+            stop_event.wait(1.0)
+            # Cameras with no faces in view would not notice a broken pool.
+            if executors.broken:
+                executors.rebuild(executors.pool)
+            if args.metrics_file and metrics.ENABLED and time.monotonic() - last_metrics >= 5.0:
+                metrics.write_textfile(args.metrics_file)
+                last_metrics = time.monotonic()
+    finally:
+        stop_event.set()
+        for sup in supervisors:
+            sup.join(timeout=5)
+        executors.shutdown()
+        visitors.flush()
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()